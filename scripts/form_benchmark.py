@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+"""
+Benchmarks for urwid_form, run against synthetic form specs without a
+terminal. Results are written as JSON so runs can be compared between
+releases.
+
+    form_benchmark.py [--depth D] [--width W] [--choices C]
+                      [--externals E] [--repeat R] [--output FILE]
+
+A spec has `width` sections at each of `depth` levels, with `width`
+fields in each section at the bottom. Fields cycle through the text,
+integer, ip_address, choice and multi types; choice and multi fields get
+`choices` options each. `externals` external fields are added at the top
+level, each registered on a couple of the generated fields.
+
+reset and reset_render time reusing the form for another run, to compare
+with build_form and first_render.
+
+Memory is reported as bytes allocated per input field, for the element
+tree alone and once every widget has been built.
+
+The time to import urwid_form.core (no urwid) and Form (with urwid) is
+measured in a fresh interpreter.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import tracemalloc
+from urwid_form import Form, compile_form
+
+FIELD_TYPES = ('text', 'integer', 'ip_address', 'choice', 'multi')
+
+def external_callback(object_type, object_name, template_name, name, var_dict):
+    return len(str(var_dict))
+
+def make_field(index, choices):
+    field_type = FIELD_TYPES[index % len(FIELD_TYPES)]
+    if field_type == 'text':
+        return {'^label': 'Text %d' % index, '^default': 'value %d' % index,
+                '^validation': r'^value'}
+    if field_type == 'integer':
+        return {'^type': 'integer', '^default': index, '^validation': r'^\d+$'}
+    if field_type == 'ip_address':
+        return {'^type': 'ip_address', '^default': '10.0.%d.%d' % (index // 256 % 256, index % 256)}
+    options = ['option_%d' % i for i in range(choices)]
+    if field_type == 'choice':
+        return {'^choices': options, '^default': options[index % choices]}
+    return {'^type': 'multi', '^choices': options, '^optional': True}
+
+def make_section(depth, width, choices, counter, paths, prefix=''):
+    section = {}
+    for i in range(width):
+        name = '%s_%d' % ('section' if depth else 'field', i)
+        path = '%s.%s' % (prefix, name) if prefix else name
+        if depth:
+            section[name] = make_section(depth - 1, width, choices, counter, paths, path)
+        else:
+            section[name] = make_field(counter[0], choices)
+            counter[0] += 1
+            paths.append(path)
+    return section
+
+def make_spec(depth=2, width=10, choices=5, externals=5):
+    """
+    Generate a form spec. Returns (spec, number of input fields).
+    """
+    paths = []
+    variables = make_section(depth, width, max(choices, 1), [0], paths)
+    for i in range(externals):
+        variables['external_%d' % i] = {
+            '^type': 'external',
+            '^callback': external_callback,
+            '^weight': 100,
+            '^registered_var_names': [paths[i % len(paths)], paths[(i * 7) % len(paths)]],
+        }
+    spec = {
+        'object_type': 'router',
+        'object_name': 'benchmark',
+        'template_name': 'synthetic',
+        'variables': variables,
+    }
+    return spec, len(paths)
+
+def timed(function):
+    start = time.time()
+    result = function()
+    return time.time() - start, result
+
+IMPORT_SCRIPT = """
+import time
+start = time.time()
+%s
+print(time.time() - start)
+"""
+
+def time_import(statement):
+    "time an import statement in a fresh interpreter"
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in sys.path if p))
+    output = subprocess.check_output(
+        [sys.executable, '-c', IMPORT_SCRIPT % statement], env=env)
+    return float(output)
+
+def run_once(spec, size):
+    timings = {}
+    timings['import_core'] = time_import('import urwid_form.core')
+    timings['import_form'] = time_import('from urwid_form import Form')
+    timings['compile_spec'], schema = timed(lambda: compile_form(spec))
+    timings['build_form'], form = timed(lambda: Form(schema))
+    timings['first_render'], _ = timed(lambda: form.loop.widget.render(size, focus=True))
+
+    def tab():
+        form.update_labels()
+        form._keypress('tab')
+        form.loop.widget.render(size, focus=True)
+    timings['tab_keypress'], _ = timed(tab)
+
+    timings['validate'], _ = timed(form.validate)
+    timings['validate_unchanged'], _ = timed(form.validate)
+    timings['get_value'], _ = timed(form.base_form_element.get_value)
+    timings['make_widgets_all'], _ = timed(form.base_form_element.make_widgets)
+
+    # running the same template again: reset() against build_form
+    timings['reset'], _ = timed(form.reset)
+    timings['reset_render'], _ = timed(lambda: form.loop.widget.render(size, focus=True))
+    return timings
+
+def measure_memory(spec, fields):
+    "bytes allocated per field by building the form, then all of its widgets"
+    schema = compile_form(spec)
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        form = Form(schema)
+        tree = tracemalloc.get_traced_memory()[0]
+        form.base_form_element.make_widgets()
+        widgets = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return {
+        'element_tree': (tree - start) // fields,
+        'with_widgets': (widgets - start) // fields,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--depth', type=int, default=2)
+    parser.add_argument('--width', type=int, default=10)
+    parser.add_argument('--choices', type=int, default=5)
+    parser.add_argument('--externals', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--columns', type=int, default=80)
+    parser.add_argument('--rows', type=int, default=24)
+    parser.add_argument('--output', help='write the JSON here instead of stdout')
+    args = parser.parse_args()
+
+    spec, fields = make_spec(args.depth, args.width, args.choices, args.externals)
+    size = (args.columns, args.rows)
+    runs = [run_once(spec, size) for i in range(args.repeat)]
+    results = {
+        'parameters': {
+            'depth': args.depth, 'width': args.width, 'choices': args.choices,
+            'externals': args.externals, 'fields': fields, 'repeat': args.repeat,
+            'size': size,
+        },
+        # best of the runs, in seconds
+        'timings': dict((name, min(run[name] for run in runs)) for name in runs[0]),
+        # bytes per field
+        'memory': measure_memory(spec, fields),
+    }
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output + '\n')
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+"""
+Measure how long it takes to get the first frame of a form on the screen,
+with and without the compiled schema cache.
+
+    form_startup.py SPEC_FILE [COLUMNS ROWS]
+
+SPEC_FILE is a .json file or a Python file that defines form_spec.
+"""
+import sys
+import time
+import shutil
+import tempfile
+from urwid_form import Form, load_schema
+
+def time_to_first_frame(path, cache_dir, size):
+    "load the spec, build the form and render it once, without a terminal"
+    start = time.time()
+    form = Form(load_schema(path, cache_dir))
+    form.update_labels()
+    form.loop.widget.render(size, focus=True)
+    return time.time() - start
+
+def main():
+    if len(sys.argv) not in (2, 4):
+        print(__doc__)
+        sys.exit(1)
+    path = sys.argv[1]
+    size = (80, 24)
+    if len(sys.argv) == 4:
+        size = (int(sys.argv[2]), int(sys.argv[3]))
+
+    cache_dir = tempfile.mkdtemp()
+    try:
+        cold = time_to_first_frame(path, cache_dir, size)
+        warm = time_to_first_frame(path, cache_dir, size)
+    finally:
+        shutil.rmtree(cache_dir)
+    print("cold: %.1f ms" % (cold * 1000))
+    print("warm: %.1f ms" % (warm * 1000))
+
+if __name__ == '__main__':
+    main()
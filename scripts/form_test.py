@@ -1,8 +1,12 @@
 #!/usr/bin/env python
+import time
+from pprint import pprint
 from urwid_form import Form
 
 def test_callback(object_type, object_name, template_name, name, arg_dict):
     import random
+    # stand in for a slow inventory service
+    time.sleep(1)
     cmf = arg_dict['CMF']
     ip_address = arg_dict['thing']['test_ip2']
     cmf_letters = list(str(cmf))
@@ -147,7 +151,7 @@ def main():
     },
 }}
 
-    form = Form(form_spec)
+    form = Form(form_spec, callback_workers=2)
     values = form()
     pprint(values)
 
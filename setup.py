@@ -5,7 +5,7 @@
 import os
 import sys
 
-from distutils.core import setup
+from setuptools import setup
 
 def main():
     setup(
@@ -17,11 +17,15 @@ def main():
           author = "Peter Banka",
           author_email = 'peter.banka@gmail.com',
           long_description = 'a simple tool to build urwid forms to fill out data',
-          scripts = ['scripts/form_test.py'],
+          scripts = ['scripts/form_test.py', 'scripts/form_startup.py',
+                     'scripts/form_benchmark.py'],
           provides = 'urwid_form',
+          python_requires = '>=3.7',
           classifiers = [
              "Development Status :: 2 - Pre-Alpha",
              "Programming Language :: Python",
+             "Programming Language :: Python :: 3",
+             "Programming Language :: Python :: 3 :: Only",
              "Operating System :: POSIX",
              "Topic :: Software Development :: Libraries :: Python Modules",
           ],
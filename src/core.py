@@ -0,0 +1,1246 @@
+#!/usr/bin/env python
+"""
+The parts of urwid_form that don't need urwid: compiling form specs,
+validation rules, the element tree and the caches. Widgets are only
+imported once an element is asked to make them.
+"""
+
+import re
+import os
+import copy
+import time
+import bisect
+import json
+import mmap
+import pickle
+import hashlib
+import tempfile
+import threading
+import weakref
+import multiprocessing
+from sys import intern
+from inspect import iscoroutinefunction
+from collections import namedtuple, OrderedDict
+from collections.abc import Mapping
+
+_accessors = {}
+
+def get_var(input_dict, accessor_string):
+    """Gets data from a dictionary using a dotted accessor-string"""
+    chunks = _accessors.get(accessor_string)
+    if chunks is None:
+        chunks = _accessors[accessor_string] = accessor_string.split('.')
+    current_data = input_dict
+    for chunk in chunks:
+        current_data = current_data.get(chunk, {})
+    return current_data
+
+def set_var(input_dict, accessor_string, value):
+    """Sets data in a dictionary using a dotted accessor-string"""
+    chunks = accessor_string.split('.')
+    current_data = input_dict
+    for chunk in chunks[:-1]:
+        current_data = current_data.setdefault(chunk, {})
+    current_data[chunks[-1]] = value
+
+def nest_values(flat):
+    """Turn a {dotted path: value} dictionary into a nested one"""
+    nested = {}
+    for path, value in flat.items():
+        set_var(nested, path, value)
+    return nested
+
+def registered_values(values, var_names):
+    """
+    The parts of a nested value dictionary named by var_names, nested the
+    same way. Names that aren't in values are left out.
+    """
+    registered = {}
+    for var_name in var_names:
+        current_data = values
+        for chunk in var_name.split('.'):
+            if not isinstance(current_data, Mapping) or chunk not in current_data:
+                break
+            current_data = current_data[chunk]
+        else:
+            set_var(registered, var_name, current_data)
+    return registered
+
+STATUS_LINE  = 'status_line'
+EDIT_LABEL   = 'edit_label'
+TEXT_UNFOCUS = 'text_unfocus'
+EDIT_FOCUS   = 'edit_focus'
+EDIT_UNFOCUS = 'edit_unfocus'
+ERR_FOCUS    = 'err_focus'
+ERR_UNFOCUS  = 'err_unfocus'
+
+def intern_text(value):
+    "names, labels and paths repeat across big templates; keep one copy of each"
+    if type(value) is str:
+        return intern(value)
+    return value
+
+NONE = "<NONE>"
+PENDING = "pending\u2026"
+
+# Choice lists longer than this are shown in a ChoiceList rather than a
+# grid of buttons
+LARGE_CHOICES = 50
+READ_WRITE = 'read_write'
+READ_ONLY = 'read_only'
+
+def _freeze(value):
+    "turn a value tree into something hashable"
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+class ValueView(Mapping):
+    """Read-only view of a nested value dictionary"""
+    def __init__(self, data):
+        self._data = data
+
+    def __getitem__(self, key):
+        value = self._data[key]
+        if isinstance(value, dict):
+            return ValueView(value)
+        if isinstance(value, list):
+            return copy.deepcopy(value)
+        return value
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return "ValueView(%r)" % self._data
+
+class CallbackCache(object):
+    """
+    Least-recently-used cache of update_function results, keyed on the
+    inputs of the callback. Entries older than ttl seconds are recomputed.
+    """
+    def __init__(self, size=128, ttl=None):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, object_type, object_name, template_name, full_name, var_dict):
+        return (object_type, object_name, template_name, full_name,
+                _freeze(var_dict))
+
+    def get(self, key):
+        "returns a (found, output) tuple"
+        entry = self.entries.get(key)
+        if entry is not None:
+            output, stamp = entry
+            if self.ttl is None or time.time() - stamp < self.ttl:
+                del self.entries[key]
+                self.entries[key] = entry
+                self.hits += 1
+                return True, output
+            del self.entries[key]
+            self.evictions += 1
+        self.misses += 1
+        return False, None
+
+    def put(self, key, output):
+        self.entries.pop(key, None)
+        self.entries[key] = (output, time.time())
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'size': len(self.entries)}
+
+def make_cache(cache_spec):
+    """
+    Build a CallbackCache from a ^cache directive: True for the defaults,
+    a dictionary of CallbackCache arguments, or False/None for no cache.
+    """
+    if not cache_spec:
+        return None
+    if cache_spec is True:
+        return CallbackCache()
+    return CallbackCache(**cache_spec)
+
+class Instrumentation(object):
+    """
+    Collects timings from a Form: the latency of each external field's
+    callback, validation and update_labels durations, the time from a
+    keypress to the next screen draw, and the number of draws. Samples can
+    also be passed on as they happen to listener(event, name, seconds).
+    If path is given, a summary is written there when the form exits.
+    """
+    # upper bounds of the histogram buckets, in milliseconds
+    BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+    def __init__(self, path=None, listener=None):
+        self.path = path
+        self.listener = listener
+        self.samples = {}
+        self.redraws = 0
+
+    def record(self, event, seconds, name=None):
+        key = event if name is None else "%s:%s" % (event, name)
+        self.samples.setdefault(key, []).append(seconds)
+        if self.listener is not None:
+            self.listener(event, name, seconds)
+
+    def histogram(self, samples):
+        "counts per bucket, keyed by the upper bound of the bucket"
+        counts = OrderedDict(("<%dms" % b, 0) for b in self.BUCKETS)
+        counts['more'] = 0
+        for seconds in samples:
+            index = bisect.bisect_left(self.BUCKETS, seconds * 1000)
+            if index < len(self.BUCKETS):
+                counts["<%dms" % self.BUCKETS[index]] += 1
+            else:
+                counts['more'] += 1
+        return counts
+
+    def summary(self):
+        summary = {'redraws': self.redraws, 'events': {}}
+        for key, samples in self.samples.items():
+            ordered = sorted(samples)
+            summary['events'][key] = {
+                'count': len(ordered),
+                'total': sum(ordered),
+                'mean': sum(ordered) / len(ordered),
+                'max': ordered[-1],
+                'p50': ordered[len(ordered) // 2],
+                'p90': ordered[int(len(ordered) * 0.9)],
+                'histogram': self.histogram(ordered),
+            }
+        return summary
+
+    def write(self, path=None):
+        with open(path or self.path, 'w') as summary_file:
+            json.dump(self.summary(), summary_file, indent=2)
+
+class Journal(object):
+    """
+    Append-only log of field changes, one JSON line of [dotted path, value]
+    per change, so that a form that was interrupted can be picked up
+    again. Writes are buffered: the file is flushed and fsynced once
+    `batch` changes are waiting and when the journal is closed. Form
+    syncs it `interval` seconds after a change from a main loop alarm,
+    so append() never waits on the disk for the time to be up.
+    """
+    def __init__(self, path, interval=1.0, batch=64):
+        self.path = path
+        self.interval = interval
+        self.batch = batch
+        self.file = None
+        self.pending = []
+
+    def replay(self):
+        """
+        Read the journal in one pass and return {dotted path: value} with
+        the last value logged for each path. A line torn by a crash is
+        skipped.
+        """
+        values = OrderedDict()
+        if not os.path.exists(self.path):
+            return values
+        with open(self.path) as journal_file:
+            for line in journal_file:
+                try:
+                    path, value = json.loads(line)
+                except ValueError:
+                    continue
+                values.pop(path, None)
+                values[path] = value
+        return values
+
+    def append(self, path, value):
+        self.pending.append(json.dumps([path, value]) + '\n')
+        if len(self.pending) >= self.batch:
+            self.sync()
+
+    def sync(self):
+        "write out and fsync whatever is waiting"
+        if not self.pending:
+            return
+        if self.file is None:
+            self.file = open(self.path, 'a+')
+            # start on a fresh line if the last write was torn
+            if self.file.tell():
+                self.file.seek(self.file.tell() - 1)
+                if self.file.read(1) != '\n':
+                    self.file.write('\n')
+        self.file.write(''.join(self.pending))
+        self.pending = []
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self, remove=False):
+        """
+        Sync and close the journal. With remove set, the file is deleted,
+        for when the form it belongs to has finished.
+        """
+        if remove:
+            self.pending = []
+        else:
+            self.sync()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if remove and os.path.exists(self.path):
+            os.remove(self.path)
+
+# A form spec is compiled once into an immutable tree of FormSchema,
+# SectionSchema and FieldSchema tuples. Widgets are then built from the
+# schema, which can be shared by any number of Form instances.
+
+FormSchema = namedtuple('FormSchema',
+    'template_name object_type object_name root')
+
+SectionSchema = namedtuple('SectionSchema', 'name path weight children')
+
+FieldSchema = namedtuple('FieldSchema',
+    'name path label default type validate_str validator optional choices '
+    'weight callback registered_var_names cache check debounce')
+
+class ChoiceProvider(object):
+    """
+    ^choices that are loaded lazily, a page at a time, in a background
+    thread. fetch(offset, limit) -- or fetch.page(offset, limit) -- returns
+    up to limit choices starting at offset, and a short page marks the
+    end. Loaded pages are kept, so every field (and form) that uses the
+    same provider shares them until refresh() is called. Only plain choice
+    fields and 'multi' fields can use a provider.
+    """
+    def __init__(self, fetch, page_size=100):
+        if hasattr(fetch, 'page'):
+            fetch = fetch.page
+        self.fetch = fetch
+        self.page_size = page_size
+        self.choices = []
+        self.complete = fetch is None
+        self.loading = False
+        self.error = None
+        # bumped by refresh(), so a page that was being loaded before it is
+        # thrown away, and lists showing the old choices start again
+        self.generation = 0
+        self.lock = threading.Lock()
+        # told (in the loading thread) through choices_loaded(provider)
+        # whenever a page has been loaded
+        self.watchers = weakref.WeakSet()
+
+    def __bool__(self):
+        # a field with a provider has choices, loaded or not
+        return True
+
+    def watch(self, watcher):
+        self.watchers.add(watcher)
+
+    def loaded(self):
+        "a (choices loaded so far, whether that is all of them) tuple"
+        with self.lock:
+            return list(self.choices), self.complete
+
+    def request(self):
+        "start loading the next page in the background, unless that is under way"
+        with self.lock:
+            if self.loading or self.complete:
+                return
+            self.loading = True
+        thread = threading.Thread(target=self.load_page)
+        thread.daemon = True
+        thread.start()
+
+    def refresh(self):
+        "forget the loaded choices; they are fetched again as they are shown"
+        with self.lock:
+            self.generation += 1
+            self.choices = []
+            self.complete = self.fetch is None
+            self.loading = False
+            self.error = None
+        for watcher in list(self.watchers):
+            watcher.choices_loaded(self)
+
+    def load_page(self):
+        "load the next page in this thread"
+        with self.lock:
+            generation = self.generation
+            offset = len(self.choices)
+        try:
+            page = list(self.fetch(offset, self.page_size))
+            error = None
+        except Exception as e:
+            page, error = [], "%s" % e
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.loading = False
+            self.error = error
+            self.choices.extend(page)
+            if error is None and len(page) < self.page_size:
+                self.complete = True
+        for watcher in list(self.watchers):
+            watcher.choices_loaded(self)
+
+    def __getstate__(self):
+        return {'fetch': self.fetch, 'page_size': self.page_size}
+
+    def __setstate__(self, state):
+        self.__init__(state['fetch'], state['page_size'])
+
+def choice_provider(choices, providers=None):
+    """
+    The ChoiceProvider for a ^choices value that is one, or a callable or
+    object with a page() method. Returns None for a plain list of choices.
+    Fields that give the same callable share the provider kept for it in
+    providers, which compile_form() keeps for the one form.
+    """
+    if isinstance(choices, ChoiceProvider):
+        return choices
+    if not callable(choices) and not hasattr(choices, 'page'):
+        return None
+    if providers is None:
+        return ChoiceProvider(choices)
+    try:
+        provider = providers.get(choices)
+    except TypeError:
+        # a fetch that can't be a key isn't shared
+        return ChoiceProvider(choices)
+    if provider is None:
+        provider = providers[choices] = ChoiceProvider(choices)
+    return provider
+
+_validators = {}
+
+def no_callback():
+    "default ^callback for fields that don't have one"
+    return '--'
+
+def compile_validator(validate_str):
+    "compiled ^validation regexes are shared between every field that uses them"
+    if not validate_str:
+        return None
+    validator = _validators.get(validate_str)
+    if validator is None:
+        validator = _validators[validate_str] = re.compile(validate_str)
+    return validator
+
+def compile_field(spec_dict, name, path, providers=None):
+    """Pull out the parts of a field spec that are relevant to the form"""
+    field_type = spec_dict.get('^type', 'text')
+    choices = spec_dict.get('^choices')
+    if choices is not None:
+        choices = choice_provider(choices, providers) or tuple(choices)
+    if isinstance(choices, ChoiceProvider) and field_type in ('multicheck', 'joblist'):
+        raise Exception("%s: a %s field can't load its ^choices lazily" % (path, field_type))
+    validate_str = spec_dict.get('^validation', None)
+    return FieldSchema(
+        name                 = intern_text(name),
+        path                 = intern_text(path),
+        label                = intern_text(spec_dict.get('^label', name)),
+        default              = spec_dict.get('^default', ''),
+        type                 = intern_text(field_type),
+        validate_str         = validate_str,
+        validator            = compile_validator(validate_str),
+        optional             = spec_dict.get('^optional', False),
+        choices              = choices,
+        weight               = spec_dict.get('^weight', 0),
+        callback             = spec_dict.get('^callback', no_callback),
+        registered_var_names = tuple(spec_dict.get('^registered_var_names', [])),
+        cache                = spec_dict.get('^cache'),
+        check                = spec_dict.get('^check'),
+        debounce             = spec_dict.get('^debounce'),
+    )
+
+def compile_section(form_spec, name='', path='', providers=None):
+    """
+    helper function to figure out the nesting of a form spec.
+    This is called recursively to create FieldSchemas and SectionSchemas.
+    """
+    children = []
+    for child_name, spec_dict in form_spec.items():
+        if type(spec_dict) != dict:
+            raise Exception('Malformed form dictionary')
+        if path:
+            child_path = "%s.%s" % (path, child_name)
+        else:
+            child_path = child_name
+        if all(key.startswith('^') for key in spec_dict):
+            # If all elements have a '^', we have a proper FormElement
+            # define
+            child = compile_field(spec_dict, child_name, child_path, providers)
+        elif any(key.startswith('^') for key in spec_dict):
+            raise Exception('Improperly formed form dictionary')
+        else:
+            child = compile_section(spec_dict, child_name, child_path, providers)
+        children.append(child)
+
+    children.sort(key=lambda x: x.weight, reverse=True)
+    weight = max([x.weight for x in children])
+    return SectionSchema(intern_text(name), intern_text(path), weight, tuple(children))
+
+def compile_form(form_spec):
+    """
+    Compile a dictionary of the form {'variables': {}, ...} into a
+    FormSchema that can be handed to Form as many times as needed.
+    """
+    return FormSchema(
+        template_name = form_spec['template_name'],
+        object_type   = form_spec['object_type'],
+        object_name   = form_spec['object_name'],
+        root          = compile_section(form_spec['variables'], providers={}),
+    )
+
+# Validation rules. These are shared by the widgets of an interactive form
+# and by Validator, so both always agree on what is acceptable.
+
+MISSING = 'a value is required'
+NO_MATCH = 'does not match %s'
+NOT_AN_IP = 'not an IP address'
+NOTHING_SELECTED = 'nothing selected'
+
+def check_pattern(validator, txt):
+    "does txt match a compiled ^validation regex (if there is one)"
+    if txt is None:
+        txt = ''
+    elif not isinstance(txt, str):
+        txt = str(txt)
+    if validator and not validator.findall(txt):
+        return False
+    return True
+
+def is_ip_address(txt):
+    if not txt:
+        return False
+    quads = txt.split('.')
+    if len(quads) != 4:
+        return False
+    try:
+        return all(x and 0 <= int(x) <= 255 for x in quads)
+    except ValueError:
+        return False
+
+def check_field(field, value, registered=None):
+    """
+    Check a value against the rules of a FieldSchema, in the shape that
+    Form returns it. Returns an error message, or None if the value is
+    acceptable. The branches follow FormElement.make_widgets().
+    A ^check of a field with ^registered_var_names is called as
+    check(value, registered), with their values nested as in a callback's
+    var_dict, so registered must be given for such a field.
+    """
+    if field.type in ('integer', 'ip_address'):
+        if not check_pattern(field.validator, value):
+            return NO_MATCH % field.validate_str
+        if field.type == 'ip_address' and not is_ip_address(value):
+            return NOT_AN_IP
+    elif field.type == 'multi' and field.choices:
+        if value and isinstance(value[0], list):
+            # Form wraps the selection of a 'multi' field in a list
+            value = value[0]
+        if not field.optional and not value:
+            return NOTHING_SELECTED
+    elif field.type == 'multicheck':
+        if not field.optional and not value:
+            return NOTHING_SELECTED
+    elif field.type == 'joblist':
+        # [comment, [jobs]]; at least one job must always be picked
+        if not value or not value[1]:
+            return NOTHING_SELECTED
+    elif field.type == 'external':
+        return None
+    elif field.type != 'long_text' and not field.choices:
+        if field.type == 'multi':
+            value = _unwrap(value)
+        if not check_pattern(field.validator, value):
+            return NO_MATCH % field.validate_str
+
+    if not field.optional and not value:
+        return MISSING
+    # a coroutine ^check can only be awaited, by Form.validate_async()
+    if field.check is not None and not iscoroutinefunction(field.check):
+        return call_check(field, value, registered)
+    return None
+
+def call_check(field, value, registered=None):
+    "call the ^check of a field (which may return a coroutine)"
+    if not field.registered_var_names:
+        return field.check(value)
+    if registered is None:
+        raise ValueError("%s: its ^check needs the values of %s" % (
+            field.path, ', '.join(field.registered_var_names)))
+    return field.check(value, registered)
+
+def _to_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, float):
+        return str(int(value))
+    if not isinstance(value, str):
+        return str(value)
+    return value
+
+def _to_int(txt):
+    try:
+        return int(txt)
+    except (ValueError, TypeError):
+        return None
+
+def _unwrap(value):
+    "the text of a 'multi' field without ^choices, from the list Form gives"
+    if isinstance(value, list):
+        return value[0] if value else ''
+    return value
+
+def _pick(labels, wanted):
+    "the labels in wanted, in the order they are offered"
+    wanted = set(str(w) for w in wanted or [])
+    return [l for l in labels if l in wanted]
+
+def default_value(field):
+    """
+    The value a field starts out with, as FormElement.get_value() would
+    report it once its widgets are built. The branches follow
+    FormElement.make_widgets().
+    """
+    default = field.default
+    if type(default) == int:
+        default = str(default)
+    if field.type == 'integer':
+        return _to_int(_to_text(default))
+    elif field.type in ('ip_address', 'long_text'):
+        return _to_text(default)
+    elif field.type == 'multi' and field.choices:
+        return [[]]
+    elif field.type == 'multicheck':
+        return []
+    elif field.type == 'joblist':
+        return ['', [str(c[0]) for c in field.choices]]
+    elif field.type == 'external':
+        return None
+    elif isinstance(field.choices, ChoiceProvider):
+        # the choices aren't known yet, so there is no first one to fall back on
+        return default or None
+    elif field.choices:
+        if default and default in field.choices:
+            return default
+        if field.optional:
+            return None
+        return field.choices[0]
+    elif field.type == 'multi':
+        # a single edit, which Form wraps in a list like any 'multi' field
+        return [_to_text(default)]
+    return _to_text(default)
+
+def _known_choices(choices):
+    "all of the choices, or None if a provider is still loading them"
+    if isinstance(choices, ChoiceProvider):
+        choices, complete = choices.loaded()
+        if not complete:
+            return None
+    return choices
+
+def normalize_value(field, value, current):
+    """
+    The value a field ends up with after FormElement.set_value(value),
+    given its current value. This is how a field without widgets keeps
+    the same state that its widgets would.
+    """
+    if field.type == 'integer':
+        return _to_int(_to_text(value))
+    elif field.type in ('ip_address', 'long_text'):
+        return _to_text(value)
+    elif field.type == 'multi' and field.choices:
+        if value and isinstance(value[0], list):
+            value = value[0]
+        choices = _known_choices(field.choices)
+        if choices is None:
+            return [[str(v) for v in value or []]]
+        return [_pick([str(c) for c in choices], value)]
+    elif field.type == 'multicheck':
+        return _pick([str(c[0]) for c in field.choices], value)
+    elif field.type == 'joblist':
+        new = list(current)
+        value = value or []
+        if len(value) > 0:
+            new[0] = _to_text(value[0])
+        if len(value) > 1:
+            new[1] = _pick([str(c[0]) for c in field.choices], value[1])
+        return new
+    elif field.type == 'external':
+        return current
+    elif field.choices:
+        if value is None:
+            return None if field.optional else current
+        choices = _known_choices(field.choices)
+        if choices is None:
+            return str(value)
+        for choice in choices:
+            if choice == str(value):
+                return choice
+        return current
+    elif field.type == 'multi':
+        return [_to_text(_unwrap(value))]
+    return _to_text(value)
+
+def iter_fields(section):
+    "Yield every FieldSchema beneath a SectionSchema"
+    for child in section.children:
+        if isinstance(child, FieldSchema):
+            yield child
+        else:
+            for field in iter_fields(child):
+                yield field
+
+class Validator(object):
+    """
+    Checks plain value dictionaries (shaped like the ones Form returns,
+    or a Form's values() view) against a form spec without building any
+    widgets.
+    """
+    def __init__(self, form_spec):
+        if not isinstance(form_spec, FormSchema):
+            form_spec = compile_form(form_spec)
+        # callbacks play no part in validation and may not be picklable.
+        # neither may choice providers, and all that matters is that the
+        # field has choices.
+        self.fields = []
+        for field in iter_fields(form_spec.root):
+            field = field._replace(callback=None)
+            if isinstance(field.choices, ChoiceProvider):
+                field = field._replace(choices=ChoiceProvider(None))
+            self.fields.append((tuple(field.path.split('.')), field))
+
+    def check(self, values):
+        "returns a dictionary of {dotted path: error message}"
+        errors = {}
+        for chunks, field in self.fields:
+            value = values
+            for chunk in chunks:
+                if not isinstance(value, Mapping):
+                    value = None
+                    break
+                value = value.get(chunk)
+            registered = None
+            if field.check is not None and field.registered_var_names:
+                registered = registered_values(values, field.registered_var_names)
+            error = check_field(field, value, registered)
+            if error is not None:
+                errors[field.path] = error
+        return errors
+
+    def iter_errors(self, records, processes=None, chunksize=256):
+        """
+        Check an iterable of value dictionaries, yielding an
+        (index, errors) tuple for each one in order. With processes set,
+        the work is spread over that many worker processes.
+        """
+        if not processes:
+            for index, values in enumerate(records):
+                yield index, self.check(values)
+            return
+
+        pool = multiprocessing.Pool(processes, _init_validator_worker, (self,))
+        try:
+            results = pool.imap(_validator_worker_check, records, chunksize)
+            for index, errors in enumerate(results):
+                yield index, errors
+        finally:
+            pool.terminate()
+
+_worker_validator = None
+
+def _init_validator_worker(validator):
+    global _worker_validator
+    _worker_validator = validator
+
+def _validator_worker_check(values):
+    return _worker_validator.check(values)
+
+# Bump this whenever the layout of the schema tuples changes so that old
+# entries in the on-disk cache are ignored.
+SCHEMA_CACHE_VERSION = b'4'
+
+def default_cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'urwid_form')
+
+def load_form_spec(path):
+    """
+    Read a form spec from a file. JSON files are parsed directly; anything
+    else is run as Python and must define a variable called form_spec.
+    """
+    if path.endswith('.json'):
+        with open(path) as spec_file:
+            return json.load(spec_file)
+    namespace = {'__file__': path}
+    with open(path) as spec_file:
+        exec(compile(spec_file.read(), path, 'exec'), namespace)
+    return namespace['form_spec']
+
+def _spec_key(path):
+    "the part of a cache file name that is the same for every version of a spec file"
+    return hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()[:16]
+
+def schema_cache_path(path, cache_dir=None):
+    "where the compiled schema for the spec file at path is cached"
+    with open(path, 'rb') as spec_file:
+        digest = hashlib.sha1(SCHEMA_CACHE_VERSION + spec_file.read())
+    return os.path.join(cache_dir or default_cache_dir(),
+                        "%s-%s.schema" % (_spec_key(path), digest.hexdigest()))
+
+def _prune_schemas(path, cache_path):
+    "remove the cached schemas of earlier versions of the spec file at path"
+    cache_dir = os.path.dirname(cache_path)
+    prefix = _spec_key(path) + '-'
+    for name in os.listdir(cache_dir):
+        old_path = os.path.join(cache_dir, name)
+        if name.startswith(prefix) and name.endswith('.schema') and old_path != cache_path:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+
+def load_schema(path, cache_dir=None):
+    """
+    Load the FormSchema for the spec file at path, using a pickled copy
+    from cache_dir if one was made from identical file contents. Editing
+    the spec file changes its hash, so stale entries are never used, and
+    they are removed when the new one is written. An entry that can't be
+    unpickled any more (a ^callback that has moved, say) is compiled
+    again. Schemas that can't be pickled (callbacks defined in the spec
+    file itself, for instance) are simply compiled every time.
+    """
+    cache_path = schema_cache_path(path, cache_dir)
+    try:
+        with open(cache_path, 'rb') as cache_file:
+            mapped = mmap.mmap(cache_file.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                return pickle.loads(mapped)
+            finally:
+                mapped.close()
+    except (IOError, OSError, ValueError, EOFError, pickle.UnpicklingError,
+            AttributeError, ImportError, IndexError, KeyError, TypeError):
+        pass
+
+    schema = compile_form(load_form_spec(path))
+    try:
+        data = pickle.dumps(schema, pickle.HIGHEST_PROTOCOL)
+    except (pickle.PicklingError, AttributeError, TypeError):
+        return schema
+
+    cache_dir = os.path.dirname(cache_path)
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        handle, tmp_path = tempfile.mkstemp(dir=cache_dir)
+        with os.fdopen(handle, 'wb') as tmp_file:
+            tmp_file.write(data)
+        os.rename(tmp_path, cache_path)
+        _prune_schemas(path, cache_path)
+    except (IOError, OSError):
+        pass
+    return schema
+
+def build_me_a_form(section, parent = None):
+    """
+    helper function to build the FormElements and NestedFormElements
+    for the children of a SectionSchema.
+    """
+    if parent == None:
+        parent = NestedFormElement(section, None)
+
+    form_elements = []
+    for schema in section.children:
+        if isinstance(schema, FieldSchema):
+            form_elements.append(FormElement(schema, parent))
+        else:
+            form_elements.append(NestedFormElement(schema, parent))
+    return form_elements
+
+class AbstractFormElement(object):
+    # there is one element per field of a template, so the element classes
+    # are slotted and read whatever they can straight from their schema
+    __slots__ = ('name', 'parent')
+
+    def __init__(self, name, parent):
+        self.name = name
+        self.parent = parent
+
+    @property
+    def full_name(self):
+        if self.parent is None:
+            return self.name
+        return "%s.%s" % (self.parent.full_name, self.name)
+
+    def tree_lines(self, child):
+        yield str(child)
+        if hasattr(child, 'get_children'):
+            children = child.get_children()
+            last = children[-1] if children else None
+            for child in children:
+                connect_chr = '-'
+                prefix = '`-' if child is last else '+-'
+                for line in self.tree_lines(child):
+                    yield prefix + line
+                    prefix = '  ' if child is last else '| '
+
+    def get_full_name(self):
+        return self.full_name
+
+    def iter_elements(self):
+        "Yield this element and every element nested beneath it"
+        yield self
+
+    def get_base_parent(self):
+        "Want to obtain the top-most parent in the structure"
+        if self.parent == None:
+            return self
+        return self.parent.get_base_parent()
+
+    def get_children(self):
+        raise AbstractMethod()
+
+    def make_widgets(self):
+        raise AbstractMethod()
+
+    def get_value(self):
+        raise AbstractMethod()
+
+    def validate(self):
+        raise AbstractMethod()
+
+    def __repr__(self):
+        raise AbstractMethod()
+
+def _schema_attribute(name):
+    "a read-only element attribute that comes straight from its schema"
+    return property(lambda self: getattr(self.schema, name))
+
+class FormElement(AbstractFormElement):
+    """This class handles every sort of form element that we can dream up"""
+    __slots__ = ('schema', 'default', 'optional', 'widgets', 'state',
+                 'restore', '_restoring', 'cache', 'dirty', 'valid', 'error',
+                 'listeners')
+
+    path = _schema_attribute('path')
+    label = _schema_attribute('label')
+    type = _schema_attribute('type')
+    validator = _schema_attribute('validator')
+    choices = _schema_attribute('choices')
+    weight = _schema_attribute('weight')
+    callback = _schema_attribute('callback')
+    registered_var_names = _schema_attribute('registered_var_names')
+    cache_spec = _schema_attribute('cache')
+
+    def __init__(self, schema, parent):
+        """
+        The interesting parts of the spec have already been pulled out
+        by compile_field()
+        """
+        AbstractFormElement.__init__(self, schema.name, parent)
+        self.schema = schema
+        self.default = schema.default
+        self.optional = schema.optional
+        self.widgets = None
+        # the value of this element while it has no widgets. restore is
+        # set once that differs from what freshly built widgets would show.
+        self.state = default_value(schema)
+        self.restore = False
+        self._restoring = False
+        self.cache = None
+        # self.valid caches the result of validate() until self.dirty is set
+        self.dirty = True
+        self.valid = None
+        self.error = None
+        # called with this element whenever the user changes its value
+        self.listeners = ()
+
+    def add_listener(self, listener):
+        "call listener with this element whenever its value changes"
+        self.listeners += (listener,)
+
+    def get_children(self):
+        if self.widgets is None:
+            return []
+        return self.widgets
+
+    def make_widgets(self):
+        """
+        Creates a set of widgets, sets self.widgets, and returns them.
+        Each widget that is created is based on self.type
+        """
+        import urwid
+        from .widgets import (BetterInt, IpEdit, EditValidator, TextDisplay,
+                              RadioSetFactory, CheckBoxSetFactory,
+                              MultiCheckFactory, JobCommentFactory,
+                              FieldAttrMap)
+
+        if self.optional:
+            required_marker = ''
+        else:
+            required_marker = '*'
+
+        style = READ_WRITE
+        caption = (EDIT_LABEL, "%s%s: " % (required_marker, self.label))
+        if type(caption) == int:
+            caption = str(caption)
+        if type(self.default) == int:
+            self.default = str(self.default)
+
+        if self.type == 'integer':
+            widgets = [BetterInt(caption, self.default, self.validator)]
+        elif self.type == 'ip_address':
+            widgets = [IpEdit(caption, self.default, self.validator)]
+        elif self.type == 'long_text':
+            widgets = [urwid.Edit(caption, self.default, multiline=True)]
+        elif self.type == 'multi' and self.choices:
+            widgets = CheckBoxSetFactory(caption, self.choices, self.optional)
+        elif self.type == 'multicheck':
+            widgets = MultiCheckFactory(caption, self.choices, self.optional)
+        elif self.type == 'joblist':
+            widgets = JobCommentFactory(caption, self.choices)
+        elif self.type == 'external':
+            widgets = [TextDisplay(self, self.name, self.label, self.callback, self.registered_var_names)]
+            self.optional = True
+            style = READ_ONLY
+        elif self.choices:
+            widgets = RadioSetFactory(caption, self.default, self.choices, self.optional)
+        else:
+            widgets = [EditValidator(caption, self.default, self.validator)]
+
+        if self.valid is False:
+            unfocus, focus = ERR_UNFOCUS, ERR_FOCUS
+        elif style == READ_WRITE:
+            unfocus, focus = EDIT_UNFOCUS, EDIT_FOCUS
+        else:
+            unfocus, focus = TEXT_UNFOCUS, TEXT_UNFOCUS
+
+        self.widgets = []
+        for widget in widgets:
+            if 'postchange' in getattr(widget, 'signals', []):
+                urwid.connect_signal(widget, 'postchange', self._changed)
+            self.widgets.append(FieldAttrMap(widget, unfocus, focus))
+
+        if self.restore:
+            self._restoring = True
+            self.set_value(self.state)
+            self._restoring = False
+        return self.widgets
+
+    def evict(self):
+        "drop the widgets, keeping just the value they hold"
+        if self.widgets is None:
+            return
+        self.state = self.get_value()[self.name]
+        self.restore = True
+        self.widgets = None
+
+    def _changed(self, *args):
+        "signal handler for the wrapped widgets"
+        if self._restoring:
+            return
+        self.dirty = True
+        for listener in self.listeners:
+            listener(self)
+
+    def get_value(self):
+        """get the value of the wrapped widget"""
+        if self.widgets is None:
+            return {self.name: copy.deepcopy(self.state)}
+        child_values = []
+        for widget in self.widgets:
+            if hasattr(widget.original_widget, 'get_edit_text'):
+                child_value = widget.original_widget.get_edit_text()
+                child_values.append(child_value)
+        if len(child_values) == 0:
+            child_values = None
+        elif len(child_values) == 1 and self.type != 'multi':
+            child_values = child_values[0]
+
+        return {self.name: child_values}
+
+    def set_value(self, value):
+        """
+        set the wrapped widgets from a value shaped like the one
+        get_value() returns for this element
+        """
+        if self.widgets is None:
+            state = normalize_value(self.schema, value, self.state)
+            if state != self.state:
+                self.state = state
+                self.restore = True
+                self._changed()
+            return
+
+        import urwid
+        widgets = [w.original_widget for w in self.widgets
+                   if hasattr(w.original_widget, 'get_edit_text')]
+        if len(widgets) == 1:
+            if self.type == 'multi' and not self.choices and isinstance(value, list):
+                # [text] for a single edit
+                values = value[:1] or ['']
+            elif self.type == 'multi' and value and isinstance(value[0], list):
+                values = value
+            else:
+                values = [value]
+        else:
+            values = value or []
+
+        for widget, child_value in zip(widgets, values):
+            if isinstance(widget, urwid.Edit):
+                child_value = _to_text(child_value)
+            widget.set_edit_text(child_value)
+
+    def registered(self, values=None):
+        """
+        What the ^check of this element is given along with its value (see
+        check_field()), picked out of values -- the value of the whole tree
+        -- or else read from the tree.
+        """
+        if self.schema.check is None or not self.registered_var_names:
+            return None
+        if values is None:
+            root = self.get_base_parent()
+            values = root.get_value()[root.name]
+        return registered_values(values, self.registered_var_names)
+
+    def validate(self, registered=None):
+        """
+        figure out if the wrapped widget has a valid value. The result is
+        cached until the user changes the value again. registered is what
+        the ^check is given, as from self.registered().
+        """
+        if not self.dirty:
+            return self.valid
+
+        if registered is None:
+            registered = self.registered()
+        self.error = check_field(self.schema, self.get_value()[self.name], registered)
+        valid = self.error is None
+        self._show_valid(valid)
+        self.valid = valid
+        self.dirty = False
+        return valid
+
+    def reset(self):
+        """
+        Go back to the ^default value, reusing the widgets if there are
+        any, and forget the last validation.
+        """
+        state = default_value(self.schema)
+        if self.widgets is None:
+            self.restore = False
+            if state != self.state:
+                self.state = state
+                self._changed()
+        elif self.get_value()[self.name] != state:
+            self.set_value(state)
+        self._show_valid(True)
+        self.valid = None
+        self.error = None
+        self.dirty = True
+
+    def fail(self, error):
+        "mark the element invalid with an error found outside of validate()"
+        self.error = error
+        self._show_valid(False)
+        self.valid = False
+
+    def _show_valid(self, valid):
+        # widgets start out coloured as valid, so only touch the attribute
+        # maps when the displayed state actually has to flip
+        if self.widgets is None or valid == (self.valid is not False):
+            return
+        if not valid:
+            unfocus, focus = ERR_UNFOCUS, ERR_FOCUS
+        else:
+            unfocus, focus = EDIT_UNFOCUS, EDIT_FOCUS
+
+        for widget in self.widgets:
+            widget.set_attr_map(unfocus)
+            widget.set_focus_map(focus)
+
+    def __repr__(self):
+        return "Form of: %s" % (self.widgets)
+
+    def __str__(self):
+        return self.name
+
+class NestedFormElement(AbstractFormElement):
+    """
+    Dictionaries that we're passing into tui_forms are nested.
+    We want to reflect that nesting in the form itself.
+    """
+    __slots__ = ('schema', 'form_elements')
+
+    path = _schema_attribute('path')
+    weight = _schema_attribute('weight')
+
+    def __init__(self, schema, parent):
+        AbstractFormElement.__init__(self, schema.name, parent)
+        self.schema = schema
+        self.form_elements = build_me_a_form(schema, self)
+
+    def get_children(self):
+        return self.form_elements
+
+    def iter_elements(self):
+        "Yield this element and every element nested beneath it"
+        yield self
+        for form_element in self.form_elements:
+            for element in form_element.iter_elements():
+                yield element
+
+    def make_widgets(self):
+        """return a list of widgets with a label prepended"""
+        import urwid
+        label = urwid.Text((EDIT_LABEL, self.name))
+        label._selectable = False
+        widgets = [label] # FIXME: should not be selectable
+        for form_element in self.form_elements:
+            for widget in form_element.make_widgets():
+                widgets.append(urwid.Padding(widget, left=4))
+        return widgets
+
+    def get_value(self):
+        """return the value of all form_element elements"""
+        form_element_values = {}
+        for form_element in self.form_elements:
+            form_element_values.update(form_element.get_value())
+        return {self.name : form_element_values}
+
+    def validate(self, values=None):
+        """
+        perform validation of all form_element elements & aggregate results.
+        values is the value of the whole tree, which is read once and
+        handed down for the ^check of fields with ^registered_var_names.
+        """
+        if values is None:
+            root = self.get_base_parent()
+            values = root.get_value()[root.name]
+        # must evaluate all of them to ensure updating
+        valid = True
+        for form_element in self.form_elements:
+            if isinstance(form_element, FormElement):
+                child_valid = form_element.validate(form_element.registered(values))
+            else:
+                child_valid = form_element.validate(values)
+            if not child_valid:
+                valid = False
+        return valid
+
+    def __repr__(self):
+        return "Nested Form of: %s" % (self.form_elements)
+
+    def __str__(self):
+        return "NESTED FORM: %s" % self.name
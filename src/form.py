@@ -0,0 +1,1198 @@
+#!/usr/bin/env python
+"""
+The Form class, which runs a form on the screen, and BulkForm, which edits
+the same fields of many records in a grid
+"""
+
+import urwid
+import os
+import copy
+import time
+import threading
+import asyncio
+import inspect
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from .core import (STATUS_LINE, EDIT_LABEL, TEXT_UNFOCUS, EDIT_FOCUS,
+                   EDIT_UNFOCUS, ERR_FOCUS, ERR_UNFOCUS, FormSchema,
+                   FormElement, NestedFormElement, Instrumentation, Journal,
+                   ChoiceProvider,
+                   ValueView,
+                   compile_form, get_var, set_var, nest_values,
+                   make_cache, iter_fields,
+                   default_value, normalize_value, check_field,
+                   call_check, registered_values)
+from .widgets import (ChildDialogExit, DialogDisplay, FormWalker,
+                      FieldAttrMap, GridCell, GridRow, GridWalker,
+                      _get_original)
+
+PALETTE = (
+    (STATUS_LINE    , 'white'      , 'dark red'   ),
+    (EDIT_LABEL     , 'default'    , 'black'      ),
+    (EDIT_FOCUS     , 'white'      , 'light blue' ,  'bold' ),
+    (EDIT_UNFOCUS   , 'light gray' , 'dark blue'  ),
+    (TEXT_UNFOCUS   , 'light gray' , 'black'  ),
+    (ERR_FOCUS      , 'white'      , 'light red'  ,  'bold' ),
+    (ERR_UNFOCUS    , 'light gray' , 'dark red'   ),
+    # Dialog box colors
+    ('border'       , 'black'      , 'black'),
+    ('shadow'       , 'white'      , 'black'),
+    ('button normal', 'light gray' , 'dark blue'  , 'standout'),
+)
+
+class CallbackRunner(object):
+    """
+    Runs the update_function of TextDisplay widgets on a pool of worker
+    threads so that slow callbacks don't freeze the screen. Requests are
+    debounced, and a request for a widget replaces any earlier request for
+    the same widget that is still waiting or running. Results are handed
+    back to the main loop through a pipe.
+    """
+    def __init__(self, loop, workers, debounce, instrument=None):
+        self.loop = loop
+        self.debounce = debounce
+        self.instrument = instrument
+        self.executor = ThreadPoolExecutor(workers)
+        self.generations = {}
+        self.alarms = {}
+        self.futures = {}
+        self.results = deque()
+        self.pipe = self.loop.watch_pipe(self._deliver)
+        # held while writing to the pipe, so shutdown() can't close it
+        # under a worker that is still finishing
+        self.pipe_lock = threading.Lock()
+
+    def submit(self, display, args):
+        """
+        Schedule display.compute(*args). Only the most recent request for
+        a given display ever reaches the screen.
+        """
+        generation = self.generations.get(display, 0) + 1
+        self.generations[display] = generation
+        alarm = self.alarms.pop(display, None)
+        if alarm is not None:
+            self.loop.remove_alarm(alarm)
+        future = self.futures.pop(display, None)
+        if future is not None:
+            future.cancel()
+        found, output = display.lookup(args)
+        if found:
+            display.show(output)
+            return
+        display.show_pending()
+        start = lambda loop, data: self._start(display, generation, args)
+        self.alarms[display] = self.loop.set_alarm_in(self.debounce, start)
+
+    def _start(self, display, generation, args):
+        "alarm handler: the debounce window has passed, hand off to a worker"
+        self.alarms.pop(display, None)
+        self.futures[display] = self.executor.submit(
+            self._work, display, generation, args)
+
+    def _work(self, display, generation, args):
+        "runs in a worker thread"
+        start = time.time()
+        try:
+            output = display.compute(*args)
+            ok = True
+        except Exception as e:
+            output = "error: %s" % e
+            ok = False
+        elapsed = time.time() - start
+        self.results.append((display, generation, args, output, ok, elapsed))
+        with self.pipe_lock:
+            if self.pipe is not None:
+                os.write(self.pipe, b'.')
+
+    def _deliver(self, data):
+        "pipe handler: runs in the main loop"
+        while self.results:
+            display, generation, args, output, ok, elapsed = self.results.popleft()
+            if self.instrument is not None:
+                self.instrument.record('callback', elapsed, display.parent.path)
+            if self.generations.get(display) != generation:
+                # the inputs changed again while this one was running
+                continue
+            self.futures.pop(display, None)
+            if ok:
+                display.remember(args, output)
+            display.show(output)
+        return True
+
+    def shutdown(self):
+        for alarm in self.alarms.values():
+            self.loop.remove_alarm(alarm)
+        self.alarms = {}
+        for future in self.futures.values():
+            future.cancel()
+        self.futures = {}
+        self.executor.shutdown(wait=False)
+        with self.pipe_lock:
+            # urwid only closes the reading end
+            self.loop.remove_watch_pipe(self.pipe)
+            os.close(self.pipe)
+            self.pipe = None
+
+class AsyncCallbackRunner(object):
+    """
+    The CallbackRunner used by Form.run_async(). Requests are debounced and
+    replaced in the same way, but each one is an asyncio task, so coroutine
+    callbacks are awaited on the event loop. Plain callbacks run on a pool
+    of worker threads if there are workers, or on the event loop if not.
+    """
+    def __init__(self, form, workers, debounce, instrument=None):
+        self.form = form
+        self.debounce = debounce
+        self.instrument = instrument
+        self.executor = None
+        if workers:
+            self.executor = ThreadPoolExecutor(workers)
+        self.tasks = {}
+
+    def submit(self, display, args):
+        """
+        Schedule display.compute(*args), cancelling any earlier request
+        for the same display.
+        """
+        task = self.tasks.pop(display, None)
+        if task is not None:
+            task.cancel()
+        found, output = display.lookup(args)
+        if found:
+            display.show(output)
+            return
+        display.show_pending()
+        self.tasks[display] = asyncio.ensure_future(self._run(display, args))
+
+    async def _run(self, display, args):
+        await asyncio.sleep(self.debounce)
+        start = time.time()
+        try:
+            if self.executor is None:
+                output = display.compute(*args)
+            else:
+                output = await asyncio.get_event_loop().run_in_executor(
+                    self.executor, display.compute, *args)
+            if inspect.isawaitable(output):
+                output = await output
+            ok = True
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            output = "error: %s" % e
+            ok = False
+        if self.instrument is not None:
+            self.instrument.record('callback', time.time() - start, display.parent.path)
+        del self.tasks[display]
+        if ok:
+            display.remember(args, output)
+        display.show(output)
+        # nothing in urwid's event loop ran, so it won't draw by itself
+        self.form._redraw()
+
+    def shutdown(self):
+        for task in self.tasks.values():
+            task.cancel()
+        self.tasks = {}
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+
+def _show_message(loop, msg):
+    "Dialog box to show a message, for Form and BulkForm"
+    widgets = [urwid.Text(msg)]
+    listbox = urwid.ListBox(urwid.SimpleListWalker([urwid.AttrWrap(w, None, 'reveal focus') for w in widgets]))
+    popup = DialogDisplay( "Error in input", 50, 10, listbox, loop)
+    popup.add_buttons([    ("OK", 0) ])
+    popup.show()
+    return popup
+
+def _run_until_done(form):
+    """
+    Run the main loop of a Form or BulkForm until it is saved or
+    cancelled. Closing a dialog ends a run() early.
+    """
+    while not form.aborted and not form.complete:
+        try:
+            form.loop.run()
+        except ChildDialogExit as cde:
+            pass
+
+class Form(object):
+    """
+    Main form class.  Returned object is callable
+    """
+    def __init__(self, form_spec, callback_workers=0, callback_debounce=0.25,
+                 cache_callbacks=False, values=None, instrument=None,
+                 max_fps=30, deltas=False, journal=None, validate_debounce=0.5):
+        """
+        We're setting up a FormWalker which will build the widgets for
+        the items we're trying to edit as they come onto the screen.
+        @param form_spec: A dictionary of the form: {'variables': {}}
+        which will call out all of the items that we want to edit, or a
+        FormSchema made from one by compile_form().
+        @param callback_workers: if non-zero, the ^callback functions of
+        external fields are run on this many worker threads instead of
+        blocking the screen.
+        @param callback_debounce: seconds to wait for further edits before
+        starting a background callback.
+        @param cache_callbacks: memoize ^callback results for external
+        fields that have no ^cache directive of their own. Takes the same
+        values as ^cache.
+        @param values: a dictionary shaped like the one this form returns,
+        used to fill in the fields instead of their ^default.
+        @param instrument: an Instrumentation to collect timings in, or True
+        for a new one. Left as None, no timings are taken at all.
+        @param max_fps: the most times a second the screen is redrawn, so
+        bursts of updates (from callback workers, say) share a frame. None
+        draws after every event, as urwid does by default.
+        @param deltas: have the form return only the fields that were
+        changed from their ^default or prefilled value, either as a
+        {dotted path: value} dictionary ('flat' or True) or as a sparse
+        nested one ('nested'). By default the full values are returned.
+        @param journal: a Journal, or the path of one, to log every change
+        to as it is made. Changes already in the journal are replayed on
+        top of values, so an interrupted session carries on where it
+        stopped. The journal is removed once the form is saved or
+        cancelled.
+        @param validate_debounce: how long after the last keystroke in a
+        field it is validated and recoloured, unless the field has its own
+        ^debounce. None leaves validation until the form is saved.
+        """
+        self.cache_callbacks = cache_callbacks
+        self.callback_workers = callback_workers
+        self.callback_debounce = callback_debounce
+        self.validate_debounce = validate_debounce
+        self._check_alarms = {}
+        self.deltas = deltas
+        self.frame_interval = 1.0 / max_fps if max_fps else 0
+        self._batch_depth = 0
+        self._draw_pending = False
+        self._draw_alarm = None
+        self._last_draw = 0
+        if instrument is True:
+            instrument = Instrumentation()
+        self.instrument = instrument
+
+        # self.base_form_element is a list of (a list of) widgets
+        if not isinstance(form_spec, FormSchema):
+            form_spec = compile_form(form_spec)
+        self.schema = form_spec
+        self.base_form_element = NestedFormElement(form_spec.root, None)
+        self.template_name = form_spec.template_name
+        self.object_type = form_spec.object_type
+        self.object_name = form_spec.object_name
+
+        self.walker = FormWalker(self.base_form_element)
+        self._index_elements()
+
+        self.body = urwid.ListBox(self.walker)
+        self.frame = urwid.Frame(
+            body   = self.body,
+            header = self._banner(),
+            footer = self._banner(),
+        )
+        self.runner = None
+        self._choices_pipe = None
+        self._choices_lock = threading.Lock()
+        self._journal_alarm = None
+        self._make_loop()
+        # set while run_async() is waiting for the form to finish
+        self._done = None
+        self._async_checked = {}
+        self.aborted = False
+        self.complete = False
+        self.popup = None
+        if values:
+            self.load_values(values)
+            self._set_baseline()
+        if journal is not None and not isinstance(journal, Journal):
+            journal = Journal(journal)
+        self.journal = journal
+        if journal is not None:
+            self._replay_journal()
+
+    def _make_loop(self, event_loop=None):
+        "set up the urwid main loop"
+        self.loop = urwid.MainLoop(
+            self.frame,
+            self._my_palette(),
+            unhandled_input = self._keypress,
+            event_loop = event_loop,
+        )
+        self._draw_alarm = None
+        if self._journal_alarm is not None:
+            # it belonged to the old main loop
+            self._journal_alarm = None
+            self.journal.sync()
+        # alarms set on the old loop will never go off
+        for element in self._check_alarms:
+            self.dirty.add(element)
+        self._check_alarms = {}
+        if self.instrument is not None:
+            self._instrument_loop()
+        self._coalesce_draws()
+
+    def _start_workers(self, asynchronous=False):
+        """
+        start the callback runner (an AsyncCallbackRunner if asynchronous),
+        and the pipe that pages of ^choices are
+        announced through. Their threads and pipes are only kept while the
+        form is running; _finished() shuts them down again.
+        """
+        if asynchronous:
+            self.runner = AsyncCallbackRunner(self, self.callback_workers,
+                                              self.callback_debounce, self.instrument)
+        elif self.callback_workers and self.runner is None:
+            self.runner = CallbackRunner(self.loop, self.callback_workers,
+                                         self.callback_debounce, self.instrument)
+        if self.provided and self._choices_pipe is None:
+            self._choices_pipe = self.loop.watch_pipe(self._refresh_choices)
+            # pages loaded while the form wasn't running
+            self._refresh_choices(b'')
+
+    def _stop_workers(self):
+        if self.runner is not None:
+            self.runner.shutdown()
+            self.runner = None
+        if self._choices_pipe is not None:
+            with self._choices_lock:
+                # urwid only closes the reading end
+                self.loop.remove_watch_pipe(self._choices_pipe)
+                os.close(self._choices_pipe)
+                self._choices_pipe = None
+
+    def choices_loaded(self, provider):
+        "called by a ChoiceProvider, in its loading thread"
+        with self._choices_lock:
+            if self._choices_pipe is not None:
+                os.write(self._choices_pipe, b'.')
+
+    def _refresh_choices(self, data):
+        "pipe handler: show the pages of choices that have been loaded"
+        for element in self.provided:
+            for widget in element.widgets or []:
+                original = _get_original(widget)
+                if hasattr(original, 'refresh_choices'):
+                    original.refresh_choices()
+        return True
+
+    def _redraw(self):
+        "draw the screen after a change made outside of urwid's event loop"
+        if self.loop.screen.started:
+            self.loop.draw_screen()
+
+    def _instrument_loop(self):
+        "time from each keypress to the draw that follows it, and count draws"
+        self._input_time = None
+        draw_screen = self.loop.draw_screen
+
+        def input_filter(keys, raw):
+            if self._input_time is None:
+                self._input_time = time.time()
+            return keys
+
+        def instrumented_draw_screen():
+            draw_screen()
+            self.instrument.redraws += 1
+            if self._input_time is not None:
+                self.instrument.record('keypress_to_draw',
+                                       time.time() - self._input_time)
+                self._input_time = None
+
+        self.loop.input_filter = input_filter
+        self.loop.draw_screen = instrumented_draw_screen
+
+    def _coalesce_draws(self):
+        "hold draws back during a batch() and to at most max_fps a second"
+        draw_screen = self.loop.draw_screen
+
+        def coalesced_draw_screen():
+            if self._batch_depth:
+                self._draw_pending = True
+                return
+            wait = self._last_draw + self.frame_interval - time.time()
+            if wait > 0:
+                self._draw_pending = True
+                if self._draw_alarm is None:
+                    self._draw_alarm = self.loop.set_alarm_in(wait, self._draw_due)
+                return
+            self._draw_pending = False
+            self._last_draw = time.time()
+            draw_screen()
+
+        self.loop.draw_screen = coalesced_draw_screen
+
+    def _draw_due(self, loop, data):
+        "alarm handler: the main loop draws the deferred frame once this returns"
+        self._draw_alarm = None
+
+    @contextmanager
+    def batch(self):
+        """
+        Group a burst of changes so that the screen is drawn once at the
+        end rather than after each of them. Batches can be nested.
+
+            with form.batch():
+                for path, value in changes:
+                    form.set(path, value)
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+        if not self._batch_depth and self._draw_pending and self.loop.screen.started:
+            self.loop.draw_screen()
+
+    def _index_elements(self):
+        """
+        Map the dotted name of every element in the tree to the element and
+        work out which external fields depend on which input fields.
+        """
+        # self.elements is the path index behind element(), get() and set()
+        self.elements = {}
+        for element in self.base_form_element.iter_elements():
+            self.elements[element.path] = element
+        self.fields = [e for e in self.elements.values()
+                       if isinstance(e, FormElement)]
+
+        # self.snapshot is the nested value dictionary, built once and then
+        # kept up to date one field at a time. self.containers maps each
+        # field to the dictionary in the snapshot that holds its value.
+        self.snapshot = self.base_form_element.get_value()['']
+        self.containers = {}
+        for element in self.fields:
+            container = self.snapshot
+            for chunk in element.path.split('.')[:-1]:
+                container = container[chunk]
+            self.containers[element] = container
+            element.add_listener(self._update_snapshot)
+            if element.type != 'external':
+                element.add_listener(self._track_change)
+
+        # self.dependents maps an input field to the external fields that
+        # need to be recomputed whenever that field changes
+        self.dependents = {}
+        self.externals = []
+        for element in self.elements.values():
+            if getattr(element, 'type', None) != 'external':
+                continue
+            self.externals.append(element)
+            if element.cache_spec is None:
+                element.cache = make_cache(self.cache_callbacks)
+            else:
+                element.cache = make_cache(element.cache_spec)
+            for var_name in element.registered_var_names:
+                registered = self.elements.get(var_name)
+                if registered is None:
+                    continue
+                for leaf in registered.iter_elements():
+                    if isinstance(leaf, FormElement):
+                        self.dependents.setdefault(leaf, []).append(element)
+
+        for element in self.dependents:
+            element.add_listener(self._field_changed)
+
+        # fields that have changed since the last call to self.validate()
+        # and fields that were invalid at that point
+        self.dirty = set(self.fields)
+        self.invalid = set()
+        for element in self.fields:
+            element.add_listener(self.dirty.add)
+
+        # as-you-type validation. self.checked_with maps a field to the
+        # fields whose ^check is given its value (through their
+        # ^registered_var_names), which are re-checked along with it.
+        self.checked_with = {}
+        for element in self.fields:
+            if element.type == 'external' or element.schema.check is None:
+                continue
+            for var_name in element.registered_var_names:
+                registered = self.elements.get(var_name)
+                if registered is None:
+                    continue
+                for leaf in registered.iter_elements():
+                    if isinstance(leaf, FormElement) and leaf is not element:
+                        self.checked_with.setdefault(leaf, []).append(element)
+        for leaf in self.checked_with:
+            leaf.add_listener(self._dirty_dependents)
+        for element in self.fields:
+            if element.type != 'external' and (
+                    element.schema.debounce is not None or
+                    self.validate_debounce is not None):
+                element.add_listener(self._schedule_check)
+
+        # fields whose ^choices are loaded in the background, and so need
+        # to hear when another page has arrived
+        self.provided = [element for element in self.fields
+                         if isinstance(element.choices, ChoiceProvider)]
+        for element in self.provided:
+            element.choices.watch(self)
+
+        # the values changes() is measured against, and the fields that
+        # currently differ from them
+        self._set_baseline()
+
+    def _replay_journal(self):
+        "restore the changes in the journal, then log new ones to it"
+        with self.batch():
+            for path, value in self.journal.replay().items():
+                if isinstance(self.elements.get(path), FormElement):
+                    self.elements[path].set_value(value)
+        for element in self.fields:
+            if element.type != 'external':
+                element.add_listener(self._journal_change)
+
+    def _journal_change(self, element):
+        self.journal.append(element.path, self.containers[element][element.name])
+        if self.journal.pending and self._journal_alarm is None:
+            self._journal_alarm = self.loop.set_alarm_in(
+                self.journal.interval, self._journal_due)
+
+    def _journal_due(self, loop, data):
+        "alarm handler: sync changes that were made since the last sync"
+        self._journal_alarm = None
+        self.journal.sync()
+
+    def reset(self, values=None):
+        """
+        Put the form back the way it was built -- ^default values, or the
+        given values prefilled -- so the same instance and widgets can be
+        run again, with form() or run_async().
+        """
+        with self.batch():
+            for element in self.fields:
+                element.reset()
+            if values:
+                self.load_values(values)
+        # nothing has been typed yet
+        for alarm in self._check_alarms.values():
+            self.loop.remove_alarm(alarm)
+        self._check_alarms = {}
+        if self.journal is not None:
+            self.journal.close(remove=True)
+        self.dirty.clear()
+        self.dirty.update(self.fields)
+        self.invalid.clear()
+        self._async_checked = {}
+        self._set_baseline()
+        if self.popup:
+            self.popup.exit()
+            self.popup = None
+        self.aborted = False
+        self.complete = False
+        self.walker.set_focus((0, 0))
+
+    def _set_baseline(self):
+        """
+        Take the current values as the ones changes() is measured against.
+        The snapshot replaces values rather than modifying them, so holding
+        on to them is enough.
+        """
+        self.baseline = dict((element, self.containers[element][element.name])
+                             for element in self.fields
+                             if element.type != 'external')
+        self.changed = set()
+
+    def _track_change(self, element):
+        "keep self.changed up to date as each field is edited"
+        if self.containers[element][element.name] == self.baseline[element]:
+            self.changed.discard(element)
+        else:
+            self.changed.add(element)
+
+    def changes(self, nested=False):
+        """
+        The fields whose values differ from their ^default or prefilled
+        value, as a {dotted path: value} dictionary, or with nested set, as
+        a sparse dictionary shaped like the one the form returns.
+        """
+        flat = dict((element.path,
+                     copy.deepcopy(self.containers[element][element.name]))
+                    for element in self.changed)
+        if nested:
+            return nest_values(flat)
+        return flat
+
+    def element(self, path):
+        "the FormElement or NestedFormElement at a dotted path"
+        return self.elements[path]
+
+    def _update_snapshot(self, element):
+        self.containers[element].update(element.get_value())
+
+    def values(self):
+        """
+        A read-only view of the current values, shaped like the dictionary
+        the form returns. The view follows later edits; nothing is copied
+        until a list is read out of it.
+        """
+        return ValueView(self.snapshot)
+
+    def get(self, path):
+        """
+        A copy of the current value at a dotted path, read from the
+        snapshot rather than the widgets.
+        """
+        element = self.elements[path]
+        if isinstance(element, FormElement):
+            value = self.containers[element][element.name]
+        else:
+            value = get_var(self.snapshot, path) if path else self.snapshot
+        return copy.deepcopy(value)
+
+    def set(self, path, value):
+        "Set the value at a dotted path, as load_values() would"
+        element = self.elements[path]
+        if isinstance(element, FormElement):
+            element.set_value(value)
+            return
+        for name, child_value in value.items():
+            if path:
+                self.set("%s.%s" % (path, name), child_value)
+            else:
+                self.set(name, child_value)
+
+    def load_values(self, values):
+        """
+        Push a dictionary shaped like the one this form returns into the
+        widgets. Each entry is looked up by its dotted path, so this is a
+        single pass over the dictionary. Entries that aren't fields of this
+        form are ignored.
+        """
+        pending = [('', values)]
+        with self.batch():
+            while pending:
+                path, data = pending.pop()
+                for name, value in data.items():
+                    if path:
+                        child_path = "%s.%s" % (path, name)
+                    else:
+                        child_path = name
+                    element = self.elements.get(child_path)
+                    if isinstance(element, FormElement):
+                        element.set_value(value)
+                    elif isinstance(value, dict):
+                        pending.append((child_path, value))
+
+    def _schedule_check(self, element):
+        """
+        validate a field once it has stopped changing for a moment. Changes
+        made in a batch (prefilling, reset) wait for the form to be saved.
+        """
+        if self._batch_depth:
+            return
+        alarm = self._check_alarms.pop(element, None)
+        if alarm is not None:
+            self.loop.remove_alarm(alarm)
+        delay = element.schema.debounce
+        if delay is None:
+            delay = self.validate_debounce
+        self._check_alarms[element] = self.loop.set_alarm_in(
+            delay, self._check_due, element)
+
+    def _check_due(self, loop, element):
+        "alarm handler: check a field and the fields registered on it"
+        self._check_alarms.pop(element, None)
+        with self.batch():
+            for checked in [element] + self.checked_with.get(element, []):
+                if checked.validate(self._registered(checked)):
+                    self.invalid.discard(checked)
+                else:
+                    self.invalid.add(checked)
+                self.dirty.discard(checked)
+
+    def _dirty_dependents(self, element):
+        "listener: the ^check of the fields registered on element sees its new value"
+        for checked in self.checked_with[element]:
+            checked.dirty = True
+            self.dirty.add(checked)
+
+    def _registered(self, element):
+        "what the ^check of element is given along with its value"
+        if element.schema.check is None or not element.registered_var_names:
+            return None
+        return self._get_registered_vars(element.registered_var_names)
+
+    def _field_changed(self, element):
+        "Recompute the external fields that depend on a changed field"
+        for external in self.dependents.get(element, []):
+            self._refresh_external(external)
+
+    def _refresh_external(self, element):
+        "Run the callback of a single external field"
+        if element.widgets is None:
+            element.make_widgets()
+        original = _get_original(element.widgets[0])
+        var_dict = self._get_registered_vars(original.registered_var_names)
+        args = (self.object_type, self.object_name, self.template_name, var_dict)
+        if self.runner is None:
+            if self.callback_workers:
+                # not running: update_labels() catches up when it starts
+                return
+            if self.instrument is None:
+                original.callback(*args)
+            else:
+                start = time.time()
+                original.callback(*args)
+                self.instrument.record('callback', time.time() - start, element.path)
+        else:
+            self.runner.submit(original, args)
+
+    def _get_registered_vars(self, var_names):
+        "Pull registered variable data out of our form"
+
+        values = {}
+        for var_name in var_names:
+            if var_name not in self.elements:
+                continue
+            current_data = values
+            chunks = var_name.split('.')
+            for chunk in chunks[:-1]:
+                current_data = current_data.setdefault(chunk, {})
+            current_data[chunks[-1]] = self.get(var_name)
+        return values
+
+    def validate(self):
+        """
+        Validate the fields that changed since the last validation and
+        report whether the whole form is valid.
+        """
+        if self.instrument is not None:
+            start = time.time()
+        with self.batch():
+            for element in self.dirty:
+                if element.validate(self._registered(element)):
+                    self.invalid.discard(element)
+                else:
+                    self.invalid.add(element)
+        self.dirty.clear()
+        if self.instrument is not None:
+            self.instrument.record('validate', time.time() - start)
+        return not self.invalid
+
+    async def validate_async(self):
+        """
+        validate(), then await the coroutine ^check of every field that
+        passed it and hasn't been checked with its current value yet. The
+        checks run concurrently.
+        """
+        self.validate()
+        pending = []
+        for element in self.fields:
+            check = element.schema.check
+            if check is None or element.valid is False or not inspect.iscoroutinefunction(check):
+                continue
+            value = self.containers[element][element.name]
+            registered = self._registered(element)
+            if self._async_checked.get(element) == (value, registered):
+                continue
+            pending.append((element, value, registered))
+        errors = await asyncio.gather(*[call_check(element.schema, value, registered)
+                                        for element, value, registered in pending])
+        with self.batch():
+            for (element, value, registered), error in zip(pending, errors):
+                if error is None:
+                    self._async_checked[element] = (value, registered)
+                else:
+                    element.fail(error)
+                    self.invalid.add(element)
+        return not self.invalid
+
+    def errors(self):
+        "returns a dictionary of {dotted path: error message} as of the last validation"
+        return dict((element.path, element.error)
+                    for element in self.invalid)
+
+    def cache_stats(self):
+        "hit/miss/eviction counters for every cached external field"
+        stats = {}
+        for element in self.externals:
+            if element.cache is not None:
+                stats[element.path] = element.cache.stats()
+        return stats
+
+    def update_labels(self):
+        """
+        Recompute every external field. Changes to individual fields are
+        picked up through self.dependents, so this is only needed to fill in
+        the labels before the form is first drawn.
+        """
+        if self.instrument is not None:
+            start = time.time()
+        with self.batch():
+            for element in self.externals:
+                self._refresh_external(element)
+        if self.instrument is not None:
+            self.instrument.record('update_labels', time.time() - start)
+
+    def _my_palette(self):
+        """defines the styles to be applied to various parts of the form"""
+        return PALETTE
+
+    def _banner(self):
+        """Text to be used for the top and bottom lines of the screen"""
+        txt =  urwid.Text('Press F10 to save & exit; F4 to cancel', align = 'center')
+        return urwid.AttrMap(txt, STATUS_LINE)
+
+    def __call__(self):
+        """Run the form & return its values"""
+        try:
+            self._start_workers()
+            self.update_labels()
+            _run_until_done(self)
+        finally:
+            self._finished()
+        return self._result()
+
+    async def run_async(self):
+        """
+        Run the form on urwid's asyncio event loop & return its values, or
+        None if it is cancelled (KeyboardInterrupt would take the event
+        loop down with it). Other tasks carry on while the form is on the
+        screen, coroutine ^callback functions are awaited, and so are
+        coroutine ^check functions when the form is saved.
+        """
+        self._make_loop(urwid.AsyncioEventLoop(loop=asyncio.get_event_loop()))
+        # the dialog exceptions end a blocking run(); here they would end
+        # up in asyncio's exception handler instead
+        process_input = self.loop.process_input
+        def dialog_process_input(keys):
+            try:
+                return process_input(keys)
+            except ChildDialogExit:
+                return True
+        self.loop.process_input = dialog_process_input
+
+        self._done = asyncio.get_event_loop().create_future()
+        try:
+            self._start_workers(asynchronous=True)
+            self.update_labels()
+            self.loop.start()
+            try:
+                await self._done
+            finally:
+                self.loop.stop()
+        finally:
+            self._done = None
+            self._finished()
+            # so the form can be run (or reset) again without asyncio
+            self._make_loop()
+        if self.aborted:
+            return None
+        return self._result()
+
+    def _exit(self):
+        "leave the form: stop the main loop, or let run_async() return"
+        if self._done is None:
+            raise urwid.ExitMainLoop()
+        if not self._done.done():
+            self._done.set_result(None)
+
+    def _finished(self):
+        self._stop_workers()
+        if self.instrument is not None and self.instrument.path:
+            self.instrument.write()
+        if self.journal is not None:
+            # kept if the form didn't finish, so it can be replayed
+            self.journal.close(remove=self.aborted or self.complete)
+
+    def _result(self):
+        if self.aborted:
+            raise KeyboardInterrupt
+        if self.deltas:
+            return self.changes(self.deltas == 'nested')
+        return copy.deepcopy(self.snapshot)
+
+    def _popup(self, msg):
+        "Dialog box to show a message"
+        self.popup = _show_message(self.loop, msg)
+
+    def _save(self, valid):
+        "F10: finish the form if it is valid, or say what is wrong"
+        if valid:
+            self.complete = True
+            self._exit()
+        else:
+            # pop a message
+            text = "Some fields missing or invalid. "\
+                   "Fields that need attention are highlighted in red."
+            self._popup(text)
+
+    async def _save_async(self):
+        self._save(await self.validate_async())
+        self._redraw()
+
+    def _keypress(self, keycode):
+        """handler for keystrokes not handled by default"""
+        if self.popup:
+            self.popup.exit()
+            self.popup = None
+        if keycode not in ('tab', 'shift tab', 'enter', 'f10', 'f4'):
+            return
+
+        if keycode == 'f10' and self._done is not None:
+            asyncio.ensure_future(self._save_async())
+        elif keycode == 'f10':
+            self._save(self.validate())
+        elif keycode == 'f4':
+            self.aborted = True
+            self._exit()
+        else:
+            if keycode == 'shift tab':
+                offset = -1
+            else: # keycode == 'tab'
+                offset = 1
+            focus_widget, position = self.body.get_focus()
+            position = self.walker.next_selectable(position, offset)
+            if position is not None:
+                self.body.set_focus(position)
+
+def cell_text(field, value):
+    "how a value is shown in a BulkForm cell"
+    if value is None:
+        return ''
+    if field.type == 'multi' and field.choices:
+        value = value[0]
+    elif field.type == 'joblist':
+        value = value[0]
+    if isinstance(value, list):
+        return ', '.join(value)
+    return ('%s' % value).split('\n')[0]
+
+class BulkForm(object):
+    """
+    Edits the same fields of many records at once. Each record is a row
+    of a grid and each field a column. Rows are built as they scroll
+    onto the screen, and there is one editor per column, shared by every
+    row. Callable like Form; returns a list with one entry per record.
+    """
+    def __init__(self, form_spec, records, columns=None, deltas=False):
+        """
+        @param form_spec: a form spec dictionary, or a FormSchema
+        @param records: a list of value dictionaries, shaped like the one
+        Form returns. Fields missing from a record start at their ^default.
+        @param columns: the dotted paths of the fields to show. By default
+        every field that isn't external.
+        @param deltas: return only the changed cells of each record, as
+        a {dotted path: value} dictionary ('flat' or True) or a sparse
+        nested one ('nested'), instead of the full values
+        """
+        if not isinstance(form_spec, FormSchema):
+            form_spec = compile_form(form_spec)
+        self.schema = form_spec
+        fields = [field for field in iter_fields(form_spec.root)
+                  if field.type != 'external']
+        if columns is not None:
+            by_path = dict((field.path, field) for field in fields)
+            fields = [by_path[path] for path in columns]
+        self.columns = fields
+        self.chunks = [field.path.split('.') for field in fields]
+        self.records = records
+        self.deltas = deltas
+        # {row: {dotted path: value}} for the cells that differ from the record
+        self.changes = {}
+        # {(row, column): error message} as of the last check
+        self.invalid = {}
+        # one FormElement per column, built the first time it is edited
+        self.editors = {}
+        self.editing = None
+
+        self.walker = GridWalker(self)
+        self.number_width = len(str(len(records))) + 1
+        header = [('fixed', self.number_width, urwid.Text(''))]
+        for field in self.columns:
+            header.append(urwid.Text((EDIT_LABEL, field.label), wrap='clip'))
+        self.hint = urwid.AttrMap(urwid.Text(
+            'Enter to edit a cell; F10 to save & exit; F4 to cancel',
+            align = 'center'), STATUS_LINE)
+        self.frame = urwid.Frame(
+            body   = urwid.ListBox(self.walker),
+            header = urwid.Columns(header, dividechars=1),
+            footer = self.hint,
+        )
+        self.loop = urwid.MainLoop(
+            self.frame,
+            PALETTE,
+            unhandled_input = self._keypress,
+        )
+        self.aborted = False
+        self.complete = False
+        self.popup = None
+
+    def _original(self, row, column):
+        "the value a cell started out with"
+        field = self.columns[column]
+        value = self.records[row]
+        for chunk in self.chunks[column]:
+            if not isinstance(value, dict) or chunk not in value:
+                return default_value(field)
+            value = value[chunk]
+        return normalize_value(field, value, default_value(field))
+
+    def value(self, row, column):
+        "the current value of a cell"
+        changes = self.changes.get(row)
+        if changes is not None:
+            path = self.columns[column].path
+            if path in changes:
+                return changes[path]
+        return self._original(row, column)
+
+    def set(self, row, path, value):
+        "Set the value of a cell, as the form does once it has been edited"
+        column = [field.path for field in self.columns].index(path)
+        field = self.columns[column]
+        self._store(row, column,
+                    normalize_value(field, value, self.value(row, column)))
+
+    def _store(self, row, column, value):
+        path = self.columns[column].path
+        changes = self.changes.setdefault(row, {})
+        if value == self._original(row, column):
+            changes.pop(path, None)
+            if not changes:
+                del self.changes[row]
+        else:
+            changes[path] = value
+        self._check(row, column, value)
+        for other, field in enumerate(self.columns):
+            if other != column and field.check is not None and any(
+                    path == name or path.startswith(name + '.')
+                    for name in field.registered_var_names):
+                # its ^check is given the value that just changed
+                self._check(row, other, self.value(row, other))
+        self.walker.refresh(row)
+
+    def _check(self, row, column, value):
+        field = self.columns[column]
+        registered = None
+        if field.check is not None and field.registered_var_names:
+            values = copy.deepcopy(self.records[row])
+            for path, changed in self.changes.get(row, {}).items():
+                set_var(values, path, changed)
+            registered = registered_values(values, field.registered_var_names)
+        error = check_field(field, value, registered)
+        if error is None:
+            self.invalid.pop((row, column), None)
+        else:
+            self.invalid[(row, column)] = error
+        return error is None
+
+    def validate(self):
+        "check every cell and report whether all of them are valid"
+        for row in range(len(self.records)):
+            for column in range(len(self.columns)):
+                self._check(row, column, self.value(row, column))
+        self.walker.rows.clear()
+        self.walker._modified()
+        return not self.invalid
+
+    def errors(self):
+        "returns {row: {dotted path: error message}} as of the last validation"
+        errors = {}
+        for (row, column), error in self.invalid.items():
+            errors.setdefault(row, {})[self.columns[column].path] = error
+        return errors
+
+    def results(self):
+        """
+        One entry per record: the record with the edited values filled in,
+        or with deltas set, the changes made to it.
+        """
+        if self.deltas == 'nested':
+            return [nest_values(copy.deepcopy(self.changes.get(row, {})))
+                    for row in range(len(self.records))]
+        if self.deltas:
+            return [copy.deepcopy(self.changes.get(row, {}))
+                    for row in range(len(self.records))]
+        results = []
+        for row, record in enumerate(self.records):
+            record = copy.deepcopy(record)
+            for column, field in enumerate(self.columns):
+                set_var(record, field.path, copy.deepcopy(self.value(row, column)))
+            results.append(record)
+        return results
+
+    def make_row(self, row):
+        "the widgets for one record, called by the GridWalker"
+        cells = [('fixed', self.number_width, urwid.Text('%d' % (row + 1)))]
+        for column, field in enumerate(self.columns):
+            cell = GridCell(cell_text(field, self.value(row, column)), wrap='clip')
+            if (row, column) in self.invalid:
+                cells.append(FieldAttrMap(cell, ERR_UNFOCUS, ERR_FOCUS))
+            else:
+                cells.append(FieldAttrMap(cell, EDIT_UNFOCUS, EDIT_FOCUS))
+        return GridRow(self.walker, cells)
+
+    def _editor(self, column):
+        editor = self.editors.get(column)
+        if editor is None:
+            editor = self.editors[column] = FormElement(self.columns[column], None)
+            editor.make_widgets()
+        return editor
+
+    def edit(self, row, column):
+        "open the shared editor of a column on one cell"
+        editor = self._editor(column)
+        editor.set_value(self.value(row, column))
+        for widget in editor.widgets:
+            original = widget.original_widget
+            if isinstance(original, urwid.Edit):
+                # the editor is shared, so the cursor is wherever the last
+                # cell was left
+                original.set_edit_pos(len(original.edit_text))
+        self.editing = (row, column)
+        hint = urwid.AttrMap(urwid.Text(
+            'Row %d. Enter or Tab to keep; Esc to cancel' % (row + 1),
+            align = 'center'), STATUS_LINE)
+        self.frame.footer = urwid.Pile([hint] + editor.widgets)
+        self.frame.focus_position = 'footer'
+
+    def _close_editor(self, keep):
+        row, column = self.editing
+        if keep:
+            field = self.columns[column]
+            self._store(row, column, self.editors[column].get_value()[field.name])
+        self.editing = None
+        self.frame.footer = self.hint
+        self.frame.focus_position = 'body'
+
+    def __call__(self):
+        """Run the grid & return the results"""
+        _run_until_done(self)
+        if self.aborted:
+            raise KeyboardInterrupt
+        return self.results()
+
+    def _popup(self, msg):
+        "Dialog box to show a message"
+        self.popup = _show_message(self.loop, msg)
+
+    def _keypress(self, keycode):
+        """handler for keystrokes not handled by default"""
+        if self.popup:
+            self.popup.exit()
+            self.popup = None
+        if self.editing is not None:
+            if keycode in ('enter', 'tab'):
+                self._close_editor(True)
+            elif keycode == 'esc':
+                self._close_editor(False)
+            return
+
+        if keycode == 'enter' and self.records and self.columns:
+            self.edit(self.walker.focus, self.walker.column)
+        elif keycode == 'f10':
+            if self.validate():
+                self.complete = True
+                raise urwid.ExitMainLoop()
+            else:
+                text = "%d cells missing or invalid. "\
+                       "Cells that need attention are highlighted in red." % len(self.invalid)
+                self._popup(text)
+        elif keycode == 'f4':
+            self.aborted = True
+            raise urwid.ExitMainLoop()
@@ -0,0 +1,972 @@
+#!/usr/bin/env python
+"""urwid widgets used to display a form"""
+
+import urwid
+import re
+import bisect
+from collections import OrderedDict
+from collections.abc import Mapping
+
+from .core import (EDIT_LABEL, NONE, PENDING, LARGE_CHOICES, NestedFormElement,
+                   ChoiceProvider, check_pattern, is_ip_address)
+
+# Exceptions to handle DialogDisplay exit codes
+
+def _get_original(widget):
+    if hasattr(widget, 'original_widget'):
+        return _get_original(widget.original_widget)
+    return widget
+
+class DialogExit(Exception):
+    def __init__(self, exitcode = 0):
+        self.exitcode = exitcode
+
+class ChildDialogExit(DialogExit):
+    pass
+
+class MainDialogExit(DialogExit):
+    pass
+
+# MyFrame makes urwid.Frame switch
+# focus between body and footer
+# when pressing 'tab'
+
+class MyFrame(urwid.Frame):
+    def keypress(self, size, key):
+        if key == 'tab':
+            if self.focus_part == 'body':
+                self.set_focus('footer')
+                return None
+            elif self.focus_part == 'footer':
+                self.set_focus('body')
+                return None
+            else:
+                # do default action if
+                # focus_part is 'header'
+                self.__super.keypress(size, key)
+        return self.__super.keypress(size, key)
+
+
+class DialogDisplay(urwid.WidgetWrap):
+    """
+    Shows a popup dialog box
+    """
+    parent = None
+    def __init__(self, text, width, height, body=None, loop=None):
+        width = int(width)
+        if width <= 0:
+            width = ('relative', 80)
+        height = int(height)
+        if height <= 0:
+            height = ('relative', 80)
+
+        if body is None:
+            # fill space with nothing
+            self.body = urwid.SolidFill(' ')
+            fp = 'footer'
+        else:
+            self.body = body
+            fp = 'body'
+        self.frame = MyFrame(self.body, focus_part = fp)
+        if text is not None:
+            self.frame.header = urwid.Pile( [urwid.Text(text),
+                urwid.Divider('\u2550')] )
+        w = self.frame
+
+        # pad area around listbox
+        w = urwid.Padding(w, ('fixed left',2), ('fixed right',2))
+        w = urwid.Filler(w, ('fixed top',1), ('fixed bottom',1))
+        w = urwid.AttrWrap(w, 'body')
+
+        w = urwid.LineBox(w)
+
+        # "shadow" effect
+        w = urwid.Columns( [w,('fixed', 1, urwid.AttrWrap(
+            urwid.Filler(urwid.Text(('border',' ')), "top")
+            ,'shadow'))])
+        w = urwid.Frame( w, footer =
+            urwid.AttrWrap(urwid.Text(('border',' ')),'shadow'))
+        if loop is None:
+            # this dialog is the main window
+            # create outermost border area
+            w = urwid.Padding(w, 'center', width )
+            w = urwid.Filler(w, 'middle', height )
+            w = urwid.AttrWrap( w, 'border' )
+        else:
+            # this dialog is a child window
+            # overlay it over the parent window
+            self.loop = loop
+            self.parent = self.loop.widget
+            w = urwid.Overlay(w, self.parent, 'center', width+2, 'middle', height+2)
+        self.view = w
+
+        # Call WidgetWrap.__init__ to correctly initialize ourselves
+        urwid.WidgetWrap.__init__(self, self.view)
+        self.is_alive = None
+
+    def add_buttons(self, buttons):
+        l = []
+        for name, exitcode in buttons:
+            b = urwid.Button( name, self.button_press )
+            b.exitcode = exitcode
+            b = urwid.AttrWrap( b, 'button normal','button select' )
+            l.append( b )
+        self.buttons = urwid.GridFlow(l, 10, 3, 1, 'center')
+        self.frame.footer = urwid.Pile( [ urwid.Divider('\u2500'),
+            self.buttons ], focus_item = 1)
+
+    def button_press(self, button):
+        if self.parent is None:
+            # We are the main window,
+            # so raise an exception to
+            # quit the main loop
+            raise MainDialogExit(button.exitcode)
+        else:
+            # We are a child window,
+            # so restore the parent widget
+            # then raise a ChildDialogExit exception
+            self.loop.widget=self.parent
+            raise ChildDialogExit(button.exitcode)
+
+    def exit(self):
+        self.loop.widget=self.parent
+
+    def show(self):
+        if self.loop is None:
+            self.loop = urwid.MainLoop(self.view, self.palette)
+            exited = False
+            while not exited:
+                try:
+                    self.loop.run()
+                except ChildDialogExit as e:
+                    # Determine which dialog has exited
+                    # and act accordingly
+                    pass
+                except MainDialogExit:
+                    exited = True
+        else:
+            self.loop.widget = self.view
+
+class FormWalker(urwid.ListWalker):
+    """
+    ListWalker over the element tree that only builds widgets for the rows
+    the ListBox asks for. The tree is flattened into blocks -- the label
+    of a section, or all of the widgets of a field -- and rows are
+    addressed by (block, offset) positions. Once more than max_blocks
+    blocks have been built, the least recently used ones are handed back
+    to their elements, which keep their value in a lightweight state
+    until they are needed again.
+    """
+    def __init__(self, base_element, max_blocks=256):
+        self.base_element = base_element
+        self.max_blocks = max_blocks
+        self.rebuild()
+
+    def rebuild(self):
+        """
+        Flatten the element tree into blocks. Call this again when sections
+        are inserted, expanded or collapsed.
+        """
+        self.blocks = []
+        self._add_blocks(self.base_element, 0)
+        # sorted block numbers of the fields that can take the focus
+        self.selectable_blocks = [
+            block for block, (element, depth, is_label) in enumerate(self.blocks)
+            if not is_label and element.type != 'external']
+        self.rows = OrderedDict()
+        self.focus = (0, 0)
+        self._modified()
+
+    def _add_blocks(self, element, depth):
+        self.blocks.append((element, depth, True))
+        for child in element.form_elements:
+            if isinstance(child, NestedFormElement):
+                self._add_blocks(child, depth + 1)
+            else:
+                self.blocks.append((child, depth + 1, False))
+
+    def _rows(self, block):
+        "the widgets for a block, building them if need be"
+        element, depth, is_label = self.blocks[block]
+        built = self.rows.pop(block, None)
+        if built is not None and (is_label or built[0] is element.widgets):
+            self.rows[block] = built
+            return built[1]
+
+        if is_label:
+            label = urwid.Text((EDIT_LABEL, element.name))
+            label._selectable = False
+            widgets = [label]
+        else:
+            if element.widgets is None:
+                element.make_widgets()
+            widgets = element.widgets
+        if depth:
+            widgets = [urwid.Padding(w, left=4 * depth) for w in widgets]
+        self.rows[block] = (element.widgets if not is_label else None, widgets)
+        self._evict()
+        return widgets
+
+    def _evict(self):
+        blocks = list(self.rows)
+        while len(self.rows) > self.max_blocks and blocks:
+            block = blocks.pop(0)
+            if block == self.focus[0]:
+                continue
+            del self.rows[block]
+            element, depth, is_label = self.blocks[block]
+            # external fields are cheap and get updated in the background
+            if not is_label and element.type != 'external':
+                element.evict()
+
+    def get_focus(self):
+        if not self.blocks:
+            return None, None
+        block, offset = self.focus
+        return self._rows(block)[offset], self.focus
+
+    def set_focus(self, position):
+        self.focus = position
+        self._modified()
+
+    def get_next(self, position):
+        block, offset = position
+        if offset + 1 < len(self._rows(block)):
+            position = (block, offset + 1)
+        elif block + 1 < len(self.blocks):
+            position = (block + 1, 0)
+        else:
+            return None, None
+        return self._rows(position[0])[position[1]], position
+
+    def get_prev(self, position):
+        block, offset = position
+        if offset > 0:
+            position = (block, offset - 1)
+        elif block > 0:
+            position = (block - 1, len(self._rows(block - 1)) - 1)
+        else:
+            return None, None
+        return self._rows(position[0])[position[1]], position
+
+    def next_selectable(self, position, offset):
+        """
+        The selectable position after (offset=1) or before (offset=-1)
+        position, wrapping around at either end. Returns None if nothing
+        is selectable. Blocks in between are skipped without being built.
+        """
+        step = 1 if offset > 0 else -1
+        block, row = position
+        rows = self._rows(block)
+        row += step
+        while 0 <= row < len(rows):
+            if rows[row].selectable():
+                return (block, row)
+            row += step
+
+        count = len(self.selectable_blocks)
+        if step > 0:
+            start = bisect.bisect_right(self.selectable_blocks, block)
+        else:
+            start = bisect.bisect_left(self.selectable_blocks, block) - 1
+        for k in range(count):
+            block = self.selectable_blocks[(start + step * k) % count]
+            rows = self._rows(block)
+            if step > 0:
+                order = range(len(rows))
+            else:
+                order = range(len(rows) - 1, -1, -1)
+            for row in order:
+                if rows[row].selectable():
+                    return (block, row)
+        return None
+
+_attr_maps = {}
+
+def _shared_attr_map(attr):
+    "one {None: attr} dict per display attribute, however many fields use it"
+    attr_map = _attr_maps.get(attr)
+    if attr_map is None:
+        attr_map = _attr_maps[attr] = {None: attr}
+    return attr_map
+
+class FieldAttrMap(urwid.AttrMap):
+    """
+    AttrMap for form fields. Plain display attributes share their mapping
+    dict with every other field instead of each widget building its own.
+    The shared dicts must never be modified.
+    """
+    def set_attr_map(self, attr_map):
+        if isinstance(attr_map, Mapping):
+            urwid.AttrMap.set_attr_map(self, attr_map)
+            return
+        self._attr_map = _shared_attr_map(attr_map)
+        self._invalidate()
+
+    def set_focus_map(self, focus_map):
+        if focus_map is None or isinstance(focus_map, Mapping):
+            urwid.AttrMap.set_focus_map(self, focus_map)
+            return
+        self._focus_map = _shared_attr_map(focus_map)
+        self._invalidate()
+
+class EditValidator(urwid.Edit, object):
+    """
+    Provide a hook for basic input validation using the ^validation directive
+    """
+    def __init__(self, caption, default, validator):
+        """
+        New up an edit Validator. validator is a ^validation regex, either
+        as a string or already compiled.
+        """
+        #noinspection PyArgumentList
+        if isinstance(default, float):
+            default = str(int(default))
+        urwid.Edit.__init__(self, caption, default)
+        self.validator = None
+        if validator:
+            self.validator = re.compile(validator)
+
+    def validate(self):
+        return check_pattern(self.validator, self.get_edit_text())
+
+    def __repr__(self):
+        return "EditValidator (%s)" % self.caption
+
+class BetterInt(EditValidator):
+    """
+    Wrap IntEdit to give it a get_edit_text() so its consistent with the
+    rest of our widgets
+    """
+    def __init__(self, caption, default, validator):
+        EditValidator.__init__(self, caption, default, validator)
+
+    def valid_char(self, char):
+        return char in "1234567890"
+
+    def get_edit_text(self):
+        """
+        Over ride our super class' get_edit_text in order to return an int.
+        """
+        txt = super(BetterInt, self).get_edit_text()
+        try:
+            return int(txt)
+        except ValueError:
+            return None
+        except TypeError:
+            return None
+
+    def __repr__(self):
+        return "BetterInt (%s)" % self.caption
+
+class IpEdit(EditValidator):
+    """Text edit subclass that only allows IP adresses"""
+    def __init__(self, caption, default, validator):
+        EditValidator.__init__(self, caption, default, validator)
+
+    def valid_char(self, char):
+        return char in "1234567890."
+
+    def validate(self):
+        if not EditValidator.validate(self):
+            return False
+        return is_ip_address(self.get_edit_text())
+
+    def __repr__(self):
+        return "IpEdit (%s)" % self.caption
+
+class TextDisplay(urwid.Text):
+    """
+    This is a widget that displays text to the user and is read-only
+    """
+    def __init__(self, parent, name, caption, update_function, registered_var_names):
+        self.parent = parent
+        self.name = name
+        self.caption = caption
+        self.update_function = update_function
+        self.registered_var_names = registered_var_names
+        urwid.Text.__init__(self, "%s: ---" % self.caption)
+
+    def validate(self):
+        return True
+
+    def compute(self, object_type, object_name, template_name, var_dict):
+        "run the update_function without touching the screen"
+        full_name = self.parent.path
+        return self.update_function(object_type, object_name, template_name,
+                                    full_name, var_dict)
+
+    def _cache_key(self, args):
+        object_type, object_name, template_name, var_dict = args
+        full_name = self.parent.path
+        return self.parent.cache.key(object_type, object_name, template_name,
+                                     full_name, var_dict)
+
+    def lookup(self, args):
+        "returns a (found, output) tuple from the cache of our element"
+        if self.parent.cache is None:
+            return False, None
+        return self.parent.cache.get(self._cache_key(args))
+
+    def remember(self, args, output):
+        if self.parent.cache is not None:
+            self.parent.cache.put(self._cache_key(args), output)
+
+    def show(self, output):
+        text = "%s: %s" % (self.caption, output)
+        if text != self.text:
+            self.set_text(text)
+
+    def show_pending(self):
+        self.show(PENDING)
+
+    def callback(self, object_type, object_name, template_name, var_dict):
+        args = (object_type, object_name, template_name, var_dict)
+        found, output = self.lookup(args)
+        if not found:
+            output = self.compute(*args)
+            self.remember(args, output)
+        self.show(output)
+
+    def __str__(self):
+        return "TextWidget: %s" % self.caption
+
+class RadioSet(urwid.WidgetWrap):
+    """Class to represent a set of radio buttons from a list of options"""
+    signals = ['postchange']
+
+    def __init__(self, default=None, choices=None, optional=False):
+        if choices is None:
+            choices = []
+
+        self.choices = choices
+        self.optional = optional
+        self.default = default
+        self.radios = []
+
+        selected = None
+        if default and default in choices:
+            selected = default
+
+        if self.optional:
+            # Make the 'none of the above' widget
+            urwid.RadioButton(self.radios, NONE, selected is None)
+
+        for c in choices:
+            if selected is None:
+                urwid.RadioButton(self.radios, c, "first True")
+            else:
+                urwid.RadioButton(self.radios, c, c == selected)
+
+        # self.selected tracks the chosen radio so that reading it is cheap
+        self.selected = None
+        for r in self.radios:
+            if r.get_state():
+                self.selected = r
+            urwid.connect_signal(r, 'postchange', self._radio_changed)
+
+        max_length = max(len(c) for c in choices)
+        if max_length < 16:
+            cell_width = max_length+4
+        else:
+            cell_width = 20
+
+        radio_grid = urwid.GridFlow(self.radios, cell_width, 1, 1, 'left')
+        urwid.WidgetWrap.__init__(self, radio_grid)
+
+    def _radio_changed(self, radio, old_state):
+        # both the old and the new selection report a change
+        if radio.get_state():
+            self.selected = radio
+            self._emit('postchange')
+
+    def set_edit_text(self, label):
+        if label is None:
+            label = NONE
+        for r in self.radios:
+            if r.get_label() == str(label):
+                r.set_state(True)
+                return
+
+    def get_edit_text(self):
+        if self.selected is None:
+            return None
+        if self.optional and self.selected.get_label() == NONE:
+            return None
+        return self.selected.get_label()
+
+    def validate(self):
+        return True
+
+    def __repr__(self):
+        return "RadioSet (%s)" % self.choices
+
+def RadioSetFactory(caption, default=None, choices=[], optional=False):
+    """factory method for a RadioSet with a label"""
+    cap = urwid.Text(caption)
+    if isinstance(choices, ChoiceProvider):
+        radios = ChoiceList(choices, False, optional)
+        if default:
+            radios.set_edit_text(default)
+        return [cap, radios]
+    if len(choices) > LARGE_CHOICES:
+        radios = ChoiceList(choices, False, optional)
+        if default and default in choices:
+            radios.set_edit_text(default)
+        return [cap, radios]
+    radios = RadioSet(default, choices, optional)
+    return [cap, radios]
+
+class CheckBoxSet(urwid.WidgetWrap):
+    """A set of linked checkbox widgets"""
+    signals = ['postchange']
+
+    def __init__(self, choices=[], optional=False, default_state=False):
+        self.optional = optional
+        choices = [ str(c) for c in choices ]
+        self.choices = choices
+        self.boxes = [urwid.CheckBox(c, state=default_state) for c in choices]
+        # self.selected holds the positions of the ticked boxes so that
+        # reading them is O(selected)
+        self.selected = set()
+        if default_state:
+            self.selected.update(range(len(self.boxes)))
+        for index, b in enumerate(self.boxes):
+            urwid.connect_signal(b, 'postchange', self._box_changed, index)
+
+        max_length = max(len(c) for c in choices)
+        if max_length < 16:
+            cell_width = max_length+4
+        else:
+            cell_width = 20
+
+        box_grid = urwid.GridFlow(self.boxes, cell_width, 1, 1, 'left')
+        urwid.WidgetWrap.__init__(self, box_grid)
+
+    def _box_changed(self, box, old_state, index):
+        if box.get_state():
+            self.selected.add(index)
+        else:
+            self.selected.discard(index)
+        self._emit('postchange')
+
+    def set_edit_text(self, labels):
+        """tick exactly the boxes in labels, reporting a single change"""
+        wanted = set(str(l) for l in labels or [])
+        changed = False
+        for index, b in enumerate(self.boxes):
+            state = b.get_label() in wanted
+            if b.get_state() != state:
+                b.set_state(state, do_callback=False)
+                if state:
+                    self.selected.add(index)
+                else:
+                    self.selected.discard(index)
+                changed = True
+        if changed:
+            self._emit('postchange')
+
+    def get_edit_text(self):
+        return [self.choices[i] for i in sorted(self.selected)]
+
+    def validate(self):
+        if not self.optional:
+            return len(self.get_edit_text()) > 0
+
+        return True
+
+    def __repr__(self):
+        return "CheckBoxSet (%s)" % self.choices
+
+def CheckBoxSetFactory(caption, choices=[], optional=False, default_state=False,
+                       descriptions=None):
+    """
+    factory method for CheckBoxSet with a label. Long lists of choices get
+    a ChoiceList instead, which shows any descriptions next to each choice.
+    """
+    cap = urwid.Text(caption)
+    if isinstance(choices, ChoiceProvider):
+        return [cap, ChoiceList(choices, True, optional)]
+    if len(choices) > LARGE_CHOICES:
+        boxes = ChoiceList([str(c) for c in choices], True, optional, descriptions)
+        if default_state:
+            boxes.set_edit_text(boxes.choices)
+        return [cap, boxes]
+    boxes = CheckBoxSet(choices, optional, default_state)
+    return [cap, boxes]
+
+def MultiCheckFactory(caption, choices, optional):
+    """
+        Input widget for more than one thing that can be picked,
+        has checkboxes and descriptions of each thing
+    """
+    if optional:
+        caption = (caption[0], "(OPTIONAL) " + caption[1])
+    cap = urwid.Text(caption)
+    div = urwid.Divider('-', 0, 0)
+
+    if len(choices) > LARGE_CHOICES:
+        return [cap] + CheckBoxSetFactory('', [c[0] for c in choices],
+            default_state=False, optional=optional,
+            descriptions=[c[1] for c in choices])
+
+    checks = CheckBoxSetFactory('', [c[0] for c in choices], default_state=False, optional=optional)
+    description = [div] + [urwid.Text("%s : %s" % (c[0], c[1])) for c in choices] + [div]
+
+    #return [cap, div] + checks + description
+    return [cap] + checks + description
+
+def JobCommentFactory(caption, choices):
+    """
+        Input widget for job comments, has a text field, checkboxes for applicable jobs
+        & descriptions of the jobs
+    """
+    cap = urwid.Text(caption)
+    txt = urwid.Edit('','', True)
+    div = urwid.Divider('-', 0, 1)
+
+    if len(choices) > LARGE_CHOICES:
+        return [cap, txt, div] + CheckBoxSetFactory('', [c[0] for c in choices],
+            default_state=True, descriptions=[c[1] for c in choices])
+
+    checks = CheckBoxSetFactory('', [c[0] for c in choices], default_state=True)
+    jobs = [urwid.Text("%s : %s" % (c[0], c[1])) for c in choices]
+
+    return [cap, txt, div] + checks + jobs
+
+
+class ChoiceIndex(object):
+    """
+    Case-insensitive substring search over a list of labels. A search for a
+    query that extends the previous one only looks through the previous
+    matches, so typing a filter one character at a time stays cheap.
+    """
+    def __init__(self, labels):
+        self.labels = [l.lower() for l in labels]
+        self.query = ''
+        self.matches = list(range(len(self.labels)))
+
+    def extend(self, labels):
+        "add labels to the end, returning the matches for the current query"
+        start = len(self.labels)
+        self.labels.extend(l.lower() for l in labels)
+        self.matches.extend(i for i in range(start, len(self.labels))
+                            if self.query in self.labels[i])
+        return self.matches
+
+    def search(self, query):
+        "positions of the labels containing query, in their original order"
+        query = query.lower()
+        if query.startswith(self.query):
+            candidates = self.matches
+        else:
+            candidates = range(len(self.labels))
+        self.matches = [i for i in candidates if query in self.labels[i]]
+        self.query = query
+        return self.matches
+
+class ChoiceRow(urwid.SelectableIcon):
+    """One row of a ChoiceList. Space or enter toggles it."""
+    def __init__(self, owner, index):
+        self.owner = owner
+        self.index = index
+        urwid.SelectableIcon.__init__(self, owner.row_text(index), 1)
+
+    def keypress(self, size, key):
+        if key in (' ', 'enter'):
+            self.owner.toggle(self.index)
+            return None
+        return key
+
+class LazyRowWalker(urwid.ListWalker):
+    """
+    ListWalker over a long list whose rows are only built, by
+    make_row(index), for the page on screen. A limited number are kept
+    around for scrolling back. Subclasses say how many positions there
+    are and which row each one shows.
+    """
+    def __init__(self, owner, max_rows=256):
+        self.owner = owner
+        self.max_rows = max_rows
+        self.rows = OrderedDict()
+        self.focus = 0
+
+    def make_row(self, index):
+        raise NotImplementedError()
+
+    def count(self):
+        "how many positions there are"
+        raise NotImplementedError()
+
+    def index(self, position):
+        "the row shown at a position"
+        return position
+
+    def at_end(self):
+        "called whenever the list is scrolled past its last position"
+        pass
+
+    def row(self, index):
+        row = self.rows.pop(index, None)
+        if row is None:
+            row = self.make_row(index)
+            while len(self.rows) >= self.max_rows:
+                self.rows.popitem(last=False)
+        self.rows[index] = row
+        return row
+
+    def get_focus(self):
+        if not self.count():
+            self.at_end()
+            return None, None
+        return self.row(self.index(self.focus)), self.focus
+
+    def set_focus(self, position):
+        self.focus = position
+        self._modified()
+
+    def get_next(self, position):
+        if position + 1 >= self.count():
+            self.at_end()
+            return None, None
+        return self.row(self.index(position + 1)), position + 1
+
+    def get_prev(self, position):
+        if position <= 0:
+            return None, None
+        return self.row(self.index(position - 1)), position - 1
+
+class ChoiceWalker(LazyRowWalker):
+    "LazyRowWalker over the choices of a ChoiceList that match its filter"
+    def make_row(self, index):
+        return ChoiceRow(self.owner, index)
+
+    def count(self):
+        return len(self.owner.matches)
+
+    def index(self, position):
+        return self.owner.matches[position]
+
+    def at_end(self):
+        self.owner.want_more()
+
+    def reset(self):
+        self.focus = 0
+        self._modified()
+
+class ChoiceList(urwid.WidgetWrap):
+    """
+    Filterable, scrolling list for very long lists of choices. Typing in
+    the filter narrows the list; space or enter picks a choice. With
+    multiple set any number of choices can be picked, otherwise it behaves
+    like a RadioSet. The selection is kept as a set of positions.
+
+    choices can also be a ChoiceProvider. Pages are then requested as the
+    list is shown and scrolled to its end, and added by refresh_choices().
+    Picked values that haven't been loaded yet are kept in self.unloaded.
+    """
+    signals = ['postchange']
+
+    def __init__(self, choices, multiple, optional, descriptions=None, height=10):
+        self.provider = None
+        if isinstance(choices, ChoiceProvider):
+            self.provider = choices
+            self.generation = choices.generation
+            choices, self.complete = choices.loaded()
+        else:
+            self.complete = True
+        self.choices = list(choices)
+        self.multiple = multiple
+        self.optional = optional
+        self.descriptions = descriptions
+        self.selected = set()
+        self.unloaded = []
+        if not multiple and not optional and self.choices and self.provider is None:
+            self.selected.add(0)
+
+        self.positions = dict((str(c), i) for i, c in enumerate(self.choices))
+        self.index = ChoiceIndex([str(c) for c in self.choices])
+        self.matches = self.index.matches
+        self.walker = ChoiceWalker(self)
+        self.filter = urwid.Edit('filter: ')
+        urwid.connect_signal(self.filter, 'postchange', self._filter_changed)
+        self.status = urwid.Text('')
+        self._update_status()
+        if self.provider is not None:
+            rows = height
+        else:
+            rows = min(height, len(self.choices)) or 1
+        listbox = urwid.BoxAdapter(urwid.ListBox(self.walker), rows)
+        urwid.WidgetWrap.__init__(self, urwid.Pile([self.filter, listbox, self.status]))
+
+    def row_text(self, index):
+        if self.multiple:
+            mark = '[X] ' if index in self.selected else '[ ] '
+        else:
+            mark = '(X) ' if index in self.selected else '( ) '
+        if self.descriptions:
+            return "%s%s : %s" % (mark, self.choices[index], self.descriptions[index])
+        return mark + str(self.choices[index])
+
+    def _update_status(self):
+        total = "%d" % len(self.choices)
+        if not self.complete:
+            total += "+"
+        status = "%s of %s shown, %d selected" % (
+            len(self.matches), total, len(self.selected) + len(self.unloaded))
+        if self.provider is not None and self.provider.loading:
+            status += ", loading\u2026"
+        elif self.provider is not None and self.provider.error:
+            status += ", error: %s" % self.provider.error
+        self.status.set_text(status)
+
+    def want_more(self):
+        "the list has been shown or scrolled to its end; load another page"
+        if self.provider is not None and not self.complete:
+            self.provider.request()
+            self._update_status()
+
+    def refresh_choices(self):
+        "pick up the pages the provider has loaded since the last call"
+        if self.provider is None:
+            return
+        if self.generation != self.provider.generation:
+            self._forget_choices()
+        choices, self.complete = self.provider.loaded()
+        new = choices[len(self.choices):]
+        start = len(self.choices)
+        self.choices.extend(new)
+        for i, c in enumerate(new):
+            self.positions[str(c)] = start + i
+        self.matches = self.index.extend([str(c) for c in new])
+        if self.unloaded:
+            found = [v for v in self.unloaded if v in self.positions]
+            self.unloaded = [v for v in self.unloaded if v not in self.positions]
+            self.selected.update(self.positions[v] for v in found)
+            if self.complete and self.unloaded:
+                # picked values that aren't among the choices after all
+                self._select(self.selected, ())
+        self.walker._modified()
+        self._update_status()
+
+    def _forget_choices(self):
+        "the provider was refreshed: start again, keeping what was picked"
+        picked = self.get_edit_text()
+        if not self.multiple:
+            picked = [] if picked is None else [picked]
+        self.generation = self.provider.generation
+        self.choices = []
+        self.positions = {}
+        self.selected = set()
+        self.unloaded = [str(v) for v in picked]
+        self.index = ChoiceIndex([])
+        self.index.search(self.filter.get_edit_text())
+        self.walker.rows.clear()
+        self.walker.focus = 0
+
+    def _filter_changed(self, edit, old_text):
+        self.matches = self.index.search(self.filter.get_edit_text())
+        self.walker.reset()
+        self._update_status()
+
+    def _select(self, selected, unloaded=()):
+        "replace the selection, redrawing only the rows that changed"
+        unloaded = list(unloaded)
+        changed = self.selected ^ selected
+        if not changed and unloaded == self.unloaded:
+            return
+        self.selected = selected
+        self.unloaded = unloaded
+        for index in changed:
+            row = self.walker.rows.get(index)
+            if row is not None:
+                row.set_text(self.row_text(index))
+        self._update_status()
+        self._emit('postchange')
+
+    def toggle(self, index):
+        if self.multiple:
+            self._select(self.selected ^ set([index]), self.unloaded)
+        elif index in self.selected:
+            if self.optional:
+                self._select(set())
+        else:
+            self._select(set([index]))
+
+    def set_edit_text(self, value):
+        positions = self.positions
+        if self.multiple:
+            unloaded = ()
+            if not self.complete:
+                unloaded = [str(v) for v in value or [] if str(v) not in positions]
+            self._select(set(positions[str(v)] for v in value or []
+                             if str(v) in positions), unloaded)
+        elif value is None:
+            if self.optional:
+                self._select(set())
+        elif str(value) in positions:
+            self._select(set([positions[str(value)]]))
+        elif not self.complete:
+            self._select(set(), [str(value)])
+
+    def get_edit_text(self):
+        if self.multiple:
+            return [self.choices[i] for i in sorted(self.selected)] + self.unloaded
+        for i in self.selected:
+            return self.choices[i]
+        for value in self.unloaded:
+            return value
+        return None
+
+    def validate(self):
+        if self.multiple and not self.optional:
+            return len(self.selected) + len(self.unloaded) > 0
+        return True
+
+    def __repr__(self):
+        return "ChoiceList (%d choices)" % len(self.choices)
+
+class GridCell(urwid.Text):
+    """A read-only cell of a BulkForm grid that can take the focus"""
+    _selectable = True
+
+    def keypress(self, size, key):
+        return key
+
+class GridRow(urwid.Columns):
+    """A row of a BulkForm grid. Remembers which column has the focus."""
+    def __init__(self, walker, cells):
+        self.walker = walker
+        urwid.Columns.__init__(self, cells, dividechars=1)
+
+    def keypress(self, size, key):
+        key = urwid.Columns.keypress(self, size, key)
+        # the first column holds the row number
+        self.walker.column = self.focus_position - 1
+        return key
+
+class GridWalker(LazyRowWalker):
+    """
+    LazyRowWalker over the records of a BulkForm. Moving up and down
+    stays in the same column.
+    """
+    def __init__(self, owner, max_rows=256):
+        LazyRowWalker.__init__(self, owner, max_rows)
+        self.column = 0
+
+    def make_row(self, index):
+        return self.owner.make_row(index)
+
+    def count(self):
+        return len(self.owner.records)
+
+    def row(self, index):
+        row = LazyRowWalker.row(self, index)
+        if row.focus_position != self.column + 1:
+            row.focus_position = self.column + 1
+        return row
+
+    def refresh(self, index):
+        "rebuild a row the next time it is shown"
+        self.rows.pop(index, None)
+        self._modified()
@@ -0,0 +1,18 @@
+"""
+The package lives in src/ but is imported as urwid_form, as setup.py
+installs it; load it from there so the tests run from a checkout.
+"""
+
+import os
+import sys
+import importlib.util
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+if 'urwid_form' not in sys.modules:
+    spec = importlib.util.spec_from_file_location(
+        'urwid_form', os.path.join(SRC, '__init__.py'),
+        submodule_search_locations=[SRC])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['urwid_form'] = module
+    spec.loader.exec_module(module)
@@ -0,0 +1,57 @@
+import time
+
+from urwid_form import CallbackCache, make_cache
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+def test_entries_expire_after_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(time, 'time', clock.time)
+    cache = CallbackCache(ttl=10)
+    cache.put('k', 'output')
+    clock.now += 9
+    assert cache.get('k') == (True, 'output')
+    clock.now += 2
+    assert cache.get('k') == (False, None)
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'evictions': 1,
+                             'size': 0}
+
+def test_least_recently_used_entry_is_evicted():
+    cache = CallbackCache(size=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == (True, 1)
+    cache.put('c', 3)
+    assert cache.get('b') == (False, None)
+    assert cache.get('a') == (True, 1)
+    assert cache.get('c') == (True, 3)
+    assert cache.stats() == {'hits': 3, 'misses': 1, 'evictions': 1,
+                             'size': 2}
+
+def test_put_replaces_an_entry_without_evicting():
+    cache = CallbackCache(size=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.put('a', 10)
+    assert cache.get('a') == (True, 10)
+    assert cache.get('b') == (True, 2)
+    assert cache.stats()['evictions'] == 0
+
+def test_key_ignores_dictionary_order():
+    cache = CallbackCache()
+    first = cache.key('t', 'o', 'tpl', 'a.b', {'x': 1, 'y': [1, 2]})
+    second = cache.key('t', 'o', 'tpl', 'a.b', {'y': [1, 2], 'x': 1})
+    cache.put(first, 'output')
+    assert cache.get(second) == (True, 'output')
+
+def test_make_cache():
+    assert make_cache(False) is None
+    assert make_cache(None) is None
+    assert make_cache(True).size == 128
+    cache = make_cache({'size': 4, 'ttl': 30})
+    assert (cache.size, cache.ttl) == (4, 30)
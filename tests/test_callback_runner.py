@@ -0,0 +1,87 @@
+import threading
+
+import pytest
+import urwid
+
+from urwid_form import CallbackRunner
+
+class FakeDisplay(object):
+    "stands in for a TextDisplay; compute() can be held until released"
+    def __init__(self):
+        self.shown = []
+        self.computed = []
+        self.release = {}
+
+    def lookup(self, args):
+        return False, None
+
+    def remember(self, args, output):
+        pass
+
+    def show(self, output):
+        self.shown.append(output)
+
+    def show_pending(self):
+        self.shown.append('pending')
+
+    def compute(self, *args):
+        event = self.release.get(args)
+        if event is not None:
+            event.wait(5)
+        self.computed.append(args)
+        return 'output for %s' % (args,)
+
+@pytest.fixture
+def runner():
+    # one worker, so a held compute() keeps later requests queued
+    runner = CallbackRunner(urwid.MainLoop(urwid.SolidFill()), 1, 0)
+    yield runner
+    if runner.pipe is not None:
+        runner.shutdown()
+
+def submit(runner, display, args):
+    "submit a request and let its debounce alarm go off now"
+    runner.submit(display, args)
+    runner.loop.remove_alarm(runner.alarms[display])
+    runner._start(display, runner.generations[display], args)
+    return runner.futures[display]
+
+def test_newer_request_drops_the_stale_result(runner):
+    display = FakeDisplay()
+    display.release[('old',)] = threading.Event()
+
+    old = submit(runner, display, ('old',))
+    new = submit(runner, display, ('new',))
+    display.release[('old',)].set()
+    old.result(5)
+    new.result(5)
+
+    runner._deliver(b'')
+    assert set(display.computed) == set([('old',), ('new',)])
+    assert display.shown[-1] == "output for ('new',)"
+    assert "output for ('old',)" not in display.shown
+
+def test_a_request_waiting_out_the_debounce_is_replaced(runner):
+    display = FakeDisplay()
+    runner.submit(display, ('first',))
+    first_alarm = runner.alarms[display]
+    runner.submit(display, ('second',))
+    assert runner.alarms[display] is not first_alarm
+    assert first_alarm not in runner.loop.event_loop._alarms
+    assert runner.generations[display] == 2
+
+def test_shutdown_cancels_waiting_work(runner):
+    busy, waiting, debounced = FakeDisplay(), FakeDisplay(), FakeDisplay()
+    busy.release[('busy',)] = threading.Event()
+    running = submit(runner, busy, ('busy',))
+    queued = submit(runner, waiting, ('waiting',))
+    runner.submit(debounced, ('debounced',))
+
+    runner.shutdown()
+    busy.release[('busy',)].set()
+    running.result(5)
+
+    assert queued.cancelled()
+    assert not runner.alarms and not runner.futures
+    assert runner.pipe is None
+    assert waiting.computed == [] and debounced.computed == []
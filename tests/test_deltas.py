@@ -0,0 +1,64 @@
+from urwid_form import Form, BulkForm
+
+def make_spec():
+    return {
+        'object_type': 'router',
+        'object_name': 'test_router',
+        'template_name': 'deltas',
+        'variables': {
+            'name': {'^default': 'alice'},
+            'server': {
+                'host': {'^default': 'localhost'},
+                'port': {'^type': 'integer', '^default': 80},
+            },
+            'role': {'^default': 'Ninja', '^choices': ['Pirate', 'Ninja']},
+        },
+    }
+
+def test_set_is_tracked_against_the_defaults():
+    form = Form(make_spec())
+    assert form.changes() == {}
+    form.set('server.port', 8080)
+    form.set('role', 'Pirate')
+    assert form.changes() == {'server.port': 8080, 'role': 'Pirate'}
+    assert form.changes(nested=True) == {'server': {'port': 8080},
+                                         'role': 'Pirate'}
+
+def test_setting_a_value_back_drops_the_change():
+    form = Form(make_spec())
+    form.set('name', 'bob')
+    form.set('server.host', 'example.com')
+    form.set('name', 'alice')
+    assert form.changes() == {'server.host': 'example.com'}
+
+def test_reset_clears_the_changes():
+    form = Form(make_spec())
+    form.set('name', 'bob')
+    form.reset()
+    assert form.changes() == {}
+    form.set('name', 'bob')
+    assert form.changes() == {'name': 'bob'}
+
+def test_reset_with_values_measures_against_them():
+    form = Form(make_spec())
+    form.reset({'name': 'carol', 'server': {'port': 8080}})
+    assert form.changes() == {}
+    form.set('server.port', 80)
+    form.set('name', 'carol')
+    assert form.changes() == {'server.port': 80}
+
+def test_deltas_are_what_the_form_returns():
+    form = Form(make_spec(), deltas='nested')
+    form.set('server.host', 'example.com')
+    assert form._result() == {'server': {'host': 'example.com'}}
+    form.deltas = True
+    assert form._result() == {'server.host': 'example.com'}
+
+def test_bulk_form_keeps_the_changes_of_each_record():
+    records = [{'name': 'alice', 'server': {'host': 'a', 'port': 1}},
+               {'name': 'bob', 'server': {'host': 'b', 'port': 2}}]
+    bulk = BulkForm(make_spec(), records, deltas='nested')
+    bulk.set(1, 'server.port', 8080)
+    bulk.set(0, 'name', 'dave')
+    bulk.set(0, 'name', 'alice')
+    assert bulk.results() == [{}, {'server': {'port': 8080}}]
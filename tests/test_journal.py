@@ -0,0 +1,47 @@
+import os
+
+from urwid_form import Journal
+
+def test_replay_keeps_the_last_value_of_each_path(tmp_path):
+    journal = Journal(str(tmp_path / 'form.journal'))
+    journal.append('a', 1)
+    journal.append('b.c', 'x')
+    journal.append('a', 2)
+    journal.close()
+    assert list(Journal(journal.path).replay().items()) == [('b.c', 'x'), ('a', 2)]
+
+def test_replay_skips_a_torn_last_line(tmp_path):
+    path = tmp_path / 'form.journal'
+    path.write_text('["a", 1]\n["b", "written"]\n["c", "tor')
+    assert dict(Journal(str(path)).replay()) == {'a': 1, 'b': 'written'}
+
+def test_appending_after_a_torn_line_starts_a_new_line(tmp_path):
+    path = tmp_path / 'form.journal'
+    path.write_text('["a", 1]\n["c", "tor')
+    journal = Journal(str(path))
+    journal.append('d', 4)
+    journal.close()
+    assert dict(Journal(str(path)).replay()) == {'a': 1, 'd': 4}
+
+def test_fsync_once_per_batch(tmp_path, monkeypatch):
+    synced = []
+    fsync = os.fsync
+    def counting_fsync(fd):
+        synced.append(fd)
+        fsync(fd)
+    monkeypatch.setattr(os, 'fsync', counting_fsync)
+
+    journal = Journal(str(tmp_path / 'form.journal'), batch=3)
+    for value in range(8):
+        journal.append('a', value)
+    assert len(synced) == 2
+    assert len(journal.pending) == 2
+    journal.close()
+    assert len(synced) == 3
+    assert Journal(journal.path).replay() == {'a': 7}
+
+def test_close_with_remove_drops_the_file(tmp_path):
+    journal = Journal(str(tmp_path / 'form.journal'), batch=1)
+    journal.append('a', 1)
+    journal.close(remove=True)
+    assert not os.path.exists(journal.path)
@@ -0,0 +1,79 @@
+"""
+Fields without widgets, and Validator, keep their own copy of the rules
+that the widgets follow. These check that both sides agree.
+"""
+
+import pytest
+
+from urwid_form import Form, Validator
+
+JOBS = [('job_a', 'label for job_a'), ('job_b', 'label for job_b')]
+ROUTERS = [('router_1', 'label for router_1'), (7, 'label for job_e')]
+
+FIELDS = {
+    'text': {'^default': 'hello', '^validation': r'^\w+$'},
+    'integer': {'^type': 'integer', '^default': 999999999,
+                '^validation': r'^\d{9}$'},
+    'ip_address': {'^type': 'ip_address', '^default': '127.0.0.1'},
+    'long_text': {'^type': 'long_text', '^default': 'one\ntwo\n'},
+    'choice': {'^default': 'Ninja', '^choices': ['Pirate', 'Ninja', 'Robot']},
+    'multi': {'^type': 'multi', '^choices': ['Pirate', 'Ninja', 'Robot']},
+    'multi_text': {'^type': 'multi', '^default': 'abc'},
+    'multicheck': {'^type': 'multicheck', '^choices': ROUTERS},
+    'joblist': {'^type': 'joblist', '^choices': JOBS},
+}
+
+# a value each field should take as it is, and one it should refuse or change
+EDITS = {
+    'text': ('world', 'two words'),
+    'integer': ('123456789', '12'),
+    'ip_address': ('10.0.0.1', '300.1.1.1'),
+    'long_text': ('three\n', ''),
+    'choice': ('Robot', 'Zombie'),
+    'multi': ([['Pirate', 'Robot']], [[]]),
+    'multi_text': (['xyz'], []),
+    'multicheck': (['7'], ['router_1', 'nope']),
+    'joblist': (['a comment', ['job_b']], ['', []]),
+}
+
+def make_spec():
+    return {
+        'object_type': 'router',
+        'object_name': 'test_router',
+        'template_name': 'parity',
+        'variables': dict((name, dict(field)) for name, field in FIELDS.items()),
+    }
+
+@pytest.mark.parametrize('name', sorted(FIELDS))
+def test_default_value_survives_make_widgets(name):
+    element = Form(make_spec()).element(name)
+    before = element.get_value()
+    element.make_widgets()
+    assert element.get_value() == before
+
+@pytest.mark.parametrize('name', sorted(FIELDS))
+@pytest.mark.parametrize('which', [0, 1])
+def test_set_value_with_and_without_widgets(name, which):
+    value = EDITS[name][which]
+    lazy = Form(make_spec()).element(name)
+    lazy.set_value(value)
+    built = Form(make_spec()).element(name)
+    built.make_widgets()
+    built.set_value(value)
+    assert lazy.get_value() == built.get_value()
+    # and building the widgets afterwards puts the same value back
+    lazy.make_widgets()
+    assert lazy.get_value() == built.get_value()
+
+@pytest.mark.parametrize('which', [0, 1])
+@pytest.mark.parametrize('build', [False, True])
+def test_validator_agrees_with_form(which, build):
+    spec = make_spec()
+    form = Form(spec)
+    if build:
+        for name in FIELDS:
+            form.element(name).make_widgets()
+    for name in FIELDS:
+        form.set(name, EDITS[name][which])
+    form.validate()
+    assert Validator(spec).check(form.values()) == form.errors()